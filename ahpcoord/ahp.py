@@ -0,0 +1,81 @@
+import itertools
+import numpy as np
+
+
+def to_pairwise_matrix(weights):
+	""" Stacked pairwise comparison matrices of elements' weights, (..., n) -> (..., n, n) """
+	weights = np.asarray(weights, dtype=float)
+
+	return weights[..., :, None] / weights[..., None, :]
+
+
+def calc_priorities(matrices, n_iterations=64, tolerance=1e-12):
+	"""
+	Local priorities, i.e. normalized principal eigenvectors, of stacked positive reciprocal matrices shaped (..., n, n).
+	Power iteration is used. For consistent matrices it converges after the first step.
+	"""
+	matrices = np.asarray(matrices, dtype=float)
+	priorities = np.full(matrices.shape[:-1], 1 / matrices.shape[-1])
+
+	for _ in range(n_iterations):
+		updated = np.einsum("...ij,...j->...i", matrices, priorities)
+		updated /= updated.sum(axis=-1, keepdims=True)
+		converged = np.abs(updated - priorities).max(initial=0) <= tolerance
+		priorities = updated
+
+		if converged:
+			break
+
+	return priorities
+
+
+class BatchGraph:
+	"""
+	Counterpart of ahpy `Graph` that synthesizes global priorities for many decision makers at once. Upper levels of the
+	hierarchy are shared, while the lowest level's local priorities get passed in bulk.
+	"""
+
+	def __init__(self, root):
+		self.root = root
+		self.__comparisons = dict()  # Node -> {(child, child other): ratio}
+
+	def set_weights(self, node, pairwise: dict):
+		""" Same input as `Graph.set_weights` takes """
+		self.__comparisons.setdefault(node, dict()).update(pairwise)
+
+	def get_local_weights(self, node):
+		""" {child: priority regarding `node`} """
+		comparisons = self.__comparisons[node]
+		children = list(dict.fromkeys(itertools.chain(*comparisons.keys())))
+		position = dict((c, i,) for i, c in enumerate(children))
+		matrix = np.ones((len(children), len(children)))
+
+		for (child, child_other), ratio in comparisons.items():
+			matrix[position[child], position[child_other]] = ratio
+			matrix[position[child_other], position[child]] = 1 / ratio
+
+		return dict(zip(children, calc_priorities(matrix)))
+
+	def get_node_weights(self, nodes):
+		""" Global priorities of `nodes`, summed over every path from the root """
+		res = dict.fromkeys(nodes, 0)
+
+		def walk(node, weight):
+			if node in res:
+				res[node] += weight
+			elif node in self.__comparisons:
+				for child, priority in self.get_local_weights(node).items():
+					walk(child, weight * priority)
+
+		walk(self.root, 1)
+
+		return np.array([res[n] for n in nodes])
+
+	def get_weights_batch(self, nodes, priorities):
+		"""
+		:param nodes: parents of the alternatives
+		:param priorities: local priorities of the alternatives regarding each of `nodes`, shaped (batch, nodes,
+		alternatives)
+		:return: global priorities of the alternatives, shaped (batch, alternatives)
+		"""
+		return np.einsum("p,bpa->ba", self.get_node_weights(nodes), priorities)
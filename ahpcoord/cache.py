@@ -0,0 +1,130 @@
+from environment import *
+import dataclasses
+import io
+import json
+import sqlite3
+import time
+
+
+class ScoreCache:
+	"""
+	Persistent content-addressed cache of agents' low-level scores, see `Simulation(score_cache=...)`. An agent's key
+	is a hash of the world's content (`World.get_digest`), the `Rules` values, the way the scores are assessed, and the
+	agent's id, so entries never get stale, they just stop being asked for. Once the entries take more than `max_size`
+	bytes, the least recently used ones get evicted.
+
+	Entries are kept in an SQLite file, which may be shared by several processes.
+	"""
+
+	VERSION = 1  # Bump on changes to the reasoning model, that make the stored scores obsolete
+	QUERY_SIZE = 500  # Max. number of keys per statement
+
+	def __init__(self, filename, max_size=1 << 30):
+		self.filename = filename
+		self.max_size = max_size
+		self.__connection = None
+
+	def __getstate__(self):
+		# Connections do not survive pickling, e.g. when handed to process pool workers
+		return dict(filename=self.filename, max_size=self.max_size)
+
+	def __setstate__(self, state):
+		self.__init__(**state)
+
+	def __connect(self):
+		if self.__connection is None:
+			self.__connection = sqlite3.connect(self.filename)
+			self.__connection.execute("CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+				"size INTEGER NOT NULL, used INTEGER NOT NULL)")
+			self.__connection.execute("CREATE INDEX IF NOT EXISTS scores_used ON scores (used)")
+
+		return self.__connection
+
+	@staticmethod
+	def get_context(world: World, rules: Rules, **kwargs):
+		"""
+		Hash of whatever, apart from the agent, the scores depend on.
+
+		:param kwargs: parameters of the assessment, e.g. `batch`. Those have to be representable in JSON
+		"""
+		context = dict(version=ScoreCache.VERSION, world=world.get_digest(), rules=dataclasses.asdict(rules), **kwargs)
+
+		return hashlib.sha256(json.dumps(context, sort_keys=True, default=str).encode()).hexdigest()
+
+	@staticmethod
+	def get_key(context, agent_id):
+		return hashlib.sha256(f"{context}:{int(agent_id)}".encode()).hexdigest()
+
+	def get_many(self, keys):
+		""" {key: stored array} for the keys found. Marks those as used """
+		connection = self.__connect()
+		res = dict()
+
+		for begin in range(0, len(keys), ScoreCache.QUERY_SIZE):
+			chunk = keys[begin:begin + ScoreCache.QUERY_SIZE]
+			rows = connection.execute(f"SELECT key, value FROM scores WHERE key IN ({','.join('?' * len(chunk))})",
+				chunk).fetchall()
+			res.update((key, np.load(io.BytesIO(value), allow_pickle=False),) for key, value in rows)
+
+		with connection:
+			connection.executemany("UPDATE scores SET used = ? WHERE key = ?", [(time.time_ns(), k,) for k in res.keys()])
+
+		Log.debug(self.get_many, "N requested:", len(keys), "N found:", len(res))
+
+		return res
+
+	def put_many(self, items):
+		"""
+		:param items: (key, array) pairs
+		"""
+		connection = self.__connect()
+		values = []
+
+		for key, value in items:
+			buffer = io.BytesIO()
+			np.save(buffer, np.asarray(value), allow_pickle=False)
+			values.append((key, buffer.getvalue(),))
+
+		with connection:
+			connection.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)",
+				[(key, value, len(value), time.time_ns(),) for key, value in values])
+
+		self.evict()
+
+	def evict(self):
+		""" Drops the least recently used entries, until the rest take at most `max_size` bytes """
+		connection = self.__connect()
+		size = self.get_size()
+
+		if size <= self.max_size:
+			return
+
+		evicted = []
+
+		for key, entry_size in connection.execute("SELECT key, size FROM scores ORDER BY used"):
+			if size <= self.max_size:
+				break
+
+			evicted.append((key,))
+			size -= entry_size
+
+		with connection:
+			connection.executemany("DELETE FROM scores WHERE key = ?", evicted)
+
+		Log.debug(self.evict, "N evicted:", len(evicted))
+
+	def get_size(self):
+		""" Bytes the entries take """
+		return self.__connect().execute("SELECT COALESCE(SUM(size), 0) FROM scores").fetchone()[0]
+
+	def __len__(self):
+		return self.__connect().execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+	def clear(self):
+		with self.__connect() as connection:
+			connection.execute("DELETE FROM scores")
+
+	def close(self):
+		if self.__connection is not None:
+			self.__connection.close()
+			self.__connection = None
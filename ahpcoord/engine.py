@@ -0,0 +1,360 @@
+from simulation import *
+from scipy.spatial import cKDTree
+import heapq
+import time
+
+
+class Engine:
+	"""
+	Executes the activities `Simulation.run` decides on. On each tick, every hitter alive either moves towards its
+	nearest target (HIT - an enemy, TAKE - a resource), away from the nearest enemy (RUN), or waits (IDLE). Then fights
+	and gathering within reach get resolved, and the world gets updated.
+
+	The state is kept in arrays, and each tick is computed for all agents at once.
+	"""
+
+	ACTIVITIES = list(Activity)
+	HIT, RUN, TAKE, IDLE = [list(Activity).index(a) for a in [Activity.HIT, Activity.RUN, Activity.TAKE, Activity.IDLE]]
+
+	def __init__(self, simulation: Simulation, decision_period=None, rival_activity=Activity.IDLE, seed=None):
+		"""
+		:param decision_period: number of ticks b/w consecutive decisions, `ticks_max` of the rules, if None
+		:param rival_activity: activity of the hitters the simulation does not decide for
+		:param seed: seed of the fights' outcomes
+		"""
+		self.simulation = simulation
+		self.rules = simulation.reasoning_model.rules
+
+		if not simulation.skip_depleted:
+			simulation.skip_depleted = True  # Ticking depletes agents
+			simulation.invalidate_scores()
+
+		self.decision_period = decision_period or self.rules.ticks_max
+		self.rng = np.random.default_rng(seed)
+		self.n_ticks = 0
+		self.time_deciding = 0.
+
+		self.agent_id, self.coord, self.energy, agent_type, team = [np.array(c) for c in simulation.world.get_columns()]
+		self.is_hitter = agent_type == Agent.Type.HITTER.value
+		self.teams, self.team = np.unique(team, return_inverse=True)  # Team codes are kept as positions in `teams`
+		self.team_resources = np.zeros(len(self.teams))
+		self.activity = np.full(len(self.agent_id), Engine.ACTIVITIES.index(rival_activity))
+		self.__rows = dict(zip(self.agent_id.tolist(), range(len(self.agent_id))))
+		self.world_dim = np.asarray(simulation.factory.world_dim, dtype=float)
+
+	def decide(self):
+		""" Updates activities of the simulation's team with the decisions of `Simulation.run` """
+		begin = time.perf_counter()
+		res = self.simulation.run()
+		rows = [self.__rows[a.id] for a in self.simulation.this_team]
+		self.activity[rows] = [Engine.ACTIVITIES.index(Activity(max(w, key=w.get))) for w in res]
+		self.time_deciding += time.perf_counter() - begin
+
+	def _get_nearest(self, rows, rows_other, enemies=False):
+		"""
+		:param enemies: only consider agents of other teams
+		:return: (nearest of `rows_other` or -1, Manhattan distance to it) for each of `rows`
+		"""
+		nearest = np.full(len(rows), -1)
+		distance = np.full(len(rows), np.inf)
+
+		if not len(rows) or not len(rows_other):
+			return nearest, distance
+
+		if enemies:
+			groups = [(rows_other[self.team[rows_other] == t], self.team[rows] != t,) for t in
+				np.unique(self.team[rows_other])]
+		else:
+			groups = [(rows_other, np.ones(len(rows), dtype=bool),)]
+
+		for candidates, is_queried in groups:
+			distance_group, i = cKDTree(self.coord[candidates]).query(self.coord[rows[is_queried]], p=1)
+			is_closer = distance_group < distance[is_queried]
+			nearest[np.flatnonzero(is_queried)[is_closer]] = candidates[i[is_closer]]
+			distance[np.flatnonzero(is_queried)[is_closer]] = distance_group[is_closer]
+
+		return nearest, distance
+
+	@staticmethod
+	def _match(rows, rows_other, distance, n):
+		""" Keeps those pairs that are the closest ones for both of their agents, so each agent is paired once at most """
+		order = np.argsort(distance, kind="stable")
+		rows, rows_other = rows[order], rows_other[order]
+		first = np.full(n, len(order))
+		np.minimum.at(first, rows, np.arange(len(order)))
+		np.minimum.at(first, rows_other, np.arange(len(order)))
+		is_kept = (first[rows] == np.arange(len(order))) & (first[rows_other] == np.arange(len(order)))
+
+		return rows[is_kept], rows_other[is_kept]
+
+	def __move(self, hitters):
+		activity = self.activity[hitters]
+		# Those who can not afford moving are waiting, see `RulesInterp.get_ticks_available`
+		can_move = (activity != Engine.IDLE) & (self.energy[hitters] >= self.rules.movement.loss_energy_moving)
+		enemy, distance_enemy = self._get_nearest(hitters, hitters, enemies=True)
+		resource, distance_resource = self._get_nearest(hitters, np.flatnonzero(~self.is_hitter & (self.energy > 0)))
+		is_taking = activity == Engine.TAKE
+		target = np.where(is_taking, resource, enemy)
+		distance = np.where(is_taking, distance_resource, distance_enemy)
+		is_moving = can_move & (target >= 0)
+
+		rows, target, distance = hitters[is_moving], target[is_moving], distance[is_moving]
+		direction = self.coord[target] - self.coord[rows]
+		direction /= np.maximum(np.abs(direction).sum(axis=1), 1e-12)[:, None]
+		is_running = self.activity[rows] == Engine.RUN
+		step = np.where(is_running, -self.rules.movement.speed, np.minimum(self.rules.movement.speed, distance))
+		self.coord[rows] = np.clip(self.coord[rows] + direction * step[:, None], 0, self.world_dim)
+
+		self.energy[hitters] += np.where(can_move, -self.rules.movement.loss_energy_moving,
+			self.rules.movement.gain_energy_waiting)
+
+	def __fight(self, hitters):
+		enemy, distance = self._get_nearest(hitters, hitters, enemies=True)
+		is_fighting = (enemy >= 0) & (distance <= self.rules.movement.speed)
+		is_fighting[is_fighting] &= (self.activity[hitters[is_fighting]] == Engine.HIT) | \
+			(self.activity[enemy[is_fighting]] == Engine.HIT)  # See `RulesInterp.is_fightable`
+		rows, rows_other = Engine._match(hitters[is_fighting], enemy[is_fighting], distance[is_fighting],
+			len(self.agent_id))
+
+		if not len(rows):
+			return 0
+
+		energy = self.energy * np.where(self.activity == Engine.HIT, 1 - self.rules.attack.loss_energy_aggressive, 1)
+		is_won = self.rng.random(len(rows)) * (energy[rows] + energy[rows_other]) < energy[rows]
+		winner, loser = np.where(is_won, rows, rows_other), np.where(is_won, rows_other, rows)
+		self.energy[winner] = energy[winner] + energy[loser] * self.rules.attack.gain_energy_win
+		np.add.at(self.team_resources, self.team[winner], energy[loser] * self.rules.attack.gain_resource_win)
+		np.add.at(self.team_resources, self.team[loser], -energy[loser] * self.rules.attack.loss_resource_lose)
+		self.energy[loser] = 0
+
+		return len(rows)
+
+	def __gather(self, hitters):
+		hitters = hitters[(self.activity[hitters] == Engine.TAKE) & (self.energy[hitters] > 0)]
+		resource, distance = self._get_nearest(hitters, np.flatnonzero(~self.is_hitter & (self.energy > 0)))
+		is_gathering = (resource >= 0) & (distance <= self.rules.movement.speed)
+		rows, resource = Engine._match(hitters[is_gathering], resource[is_gathering], distance[is_gathering],
+			len(self.agent_id))
+		self.energy[rows] += self.energy[resource] * self.rules.resource.gain_energy
+		np.add.at(self.team_resources, self.team[rows], self.energy[resource] * self.rules.resource.gain_resource)
+		self.energy[resource] = 0
+
+		return len(rows)
+
+	def step(self):
+		""" Runs a tick """
+		if self.n_ticks % self.decision_period == 0:
+			self.decide()
+
+		coord, energy = self.coord.copy(), self.energy.copy()
+		hitters = np.flatnonzero((self.energy > 0) & self.is_hitter)
+		self.__move(hitters)
+		n_fights = self.__fight(hitters)
+		n_gathered = self.__gather(hitters)
+		self._sync(coord, energy)
+		self.n_ticks += 1
+
+		if __debug__:
+			Log.debug(self.step, "tick:", self.n_ticks, "N fights:", n_fights, "N gathered:", n_gathered)
+
+	def _sync(self, coord, energy):
+		""" Writes the agents whose coordinates or energies differ from `coord` and `energy` to the world """
+		changed = np.flatnonzero((self.coord != coord).any(axis=1) | (self.energy != energy))
+		self.simulation.world.update_agents(self.agent_id[changed], self.coord[changed], self.energy[changed])
+
+	def _advance(self, n_ticks_max):
+		""" Runs as many ticks as convenient, but no more than `n_ticks_max` """
+		self.step()
+
+	def run(self, n_ticks):
+		"""
+		:return: {"n_ticks", "elapsed", "ticks_per_second", "time_deciding", "n_alive", "team_resources": {team:
+		resources}}. "time_deciding" is the part of "elapsed" spent in `Simulation.run`
+		"""
+		begin = time.perf_counter()
+		time_deciding = self.time_deciding
+		n_ticks_end = self.n_ticks + n_ticks
+
+		while self.n_ticks < n_ticks_end:
+			self._advance(n_ticks_end - self.n_ticks)
+
+		elapsed = time.perf_counter() - begin
+		res = dict(n_ticks=n_ticks, elapsed=elapsed, ticks_per_second=n_ticks / elapsed if elapsed > 0 else float("inf"),
+			time_deciding=self.time_deciding - time_deciding, n_alive=int(np.sum((self.energy > 0) & self.is_hitter)),
+			team_resources=dict(zip(self.teams.tolist(), self.team_resources.tolist())))
+		Log.info(self.run, res)
+
+		return res
+
+
+class EventEngine(Engine):
+	"""
+	Event-driven counterpart of `Engine`. Instead of scanning every tick, each decision period it works out the earliest
+	contact tick of every pair of agents that may interact (see `RulesInterp.is_reachable`), from their speeds, the
+	ticks their energy lets them move for (see `RulesInterp.get_ticks_available`), and the distance. The contacts get
+	scheduled in a priority queue, and only those are processed, ticks with no contacts cost nothing.
+
+	Each moving hitter heads straight for its earliest contact, or for its nearest target, if there is none, over the
+	whole period. A pair only gets closer, if at least one of the agents heads for the other one. `Engine` re-targets
+	on each tick instead, so the trajectories differ.
+	"""
+
+	FIGHT, GATHER = range(2)
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.n_events = 0
+
+	def __get_pairs(self, hitters, resources, n_ticks):
+		""" (rows, rows other, distances, kinds) of the pairs that might get in contact within `n_ticks` """
+		speed = self.rules.movement.speed
+		rows, rows_other, kinds = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=int)
+
+		if len(hitters):
+			pairs = cKDTree(self.coord[hitters]).query_pairs(speed * (2 * n_ticks + 1), p=1, output_type="ndarray")
+			rows, rows_other = hitters[pairs[:, 0]], hitters[pairs[:, 1]]
+			is_fightable = (self.team[rows] != self.team[rows_other]) & ((self.activity[rows] == Engine.HIT) |
+				(self.activity[rows_other] == Engine.HIT))  # See `RulesInterp.is_fightable`
+			rows, rows_other = rows[is_fightable], rows_other[is_fightable]
+			kinds = np.full(len(rows), EventEngine.FIGHT)
+
+		takers = hitters[self.activity[hitters] == Engine.TAKE]
+
+		if len(takers) and len(resources):
+			pairs = cKDTree(self.coord[takers]).sparse_distance_matrix(cKDTree(self.coord[resources]),
+				speed * (n_ticks + 1), p=1, output_type="ndarray")
+			rows = np.concatenate([rows, takers[pairs["i"]]])
+			rows_other = np.concatenate([rows_other, resources[pairs["j"]]])
+			kinds = np.concatenate([kinds, np.full(len(pairs), EventEngine.GATHER)])
+
+		distance = np.abs(self.coord[rows] - self.coord[rows_other]).sum(axis=1)
+
+		return rows, rows_other, distance, kinds
+
+	def __get_contact_ticks(self, rate, rate_other, n_moving, n_moving_other, distance, n_ticks):
+		""" Earliest ticks the pairs get in contact at, counting from 1, or 0, if they do not within `n_ticks` """
+		ticks = np.arange(1, n_ticks + 1)
+		closing = rate[:, None] * np.minimum(ticks[None, :], n_moving[:, None]) + \
+			rate_other[:, None] * np.minimum(ticks[None, :], n_moving_other[:, None])
+		is_contact = closing >= (distance - self.rules.movement.speed)[:, None]
+
+		return np.where(is_contact.any(axis=1), np.argmax(is_contact, axis=1) + 1, 0)
+
+	def __get_energy(self, rows, n_moving, tick):
+		""" Energy by the end of the period's `tick`, interactions aside """
+		movement = self.rules.movement
+		n_moved = np.minimum(tick, n_moving[rows])
+
+		return self.energy[rows] + self.is_hitter[rows] * (movement.gain_energy_waiting * (tick - n_moved) -
+			movement.loss_energy_moving * n_moved)
+
+	def __process(self, events, n_moving):
+		"""
+		Resolves the interactions in the order of their ticks. Those involving agents dead, consumed, or busy with
+		another interaction at the same tick are dropped.
+
+		:param events: (tick of the period, kind, row, row other)
+		:return: (energy deltas caused by the interactions, ticks of the period the agents have died at)
+		"""
+		delta = np.zeros(len(self.agent_id))
+		tick_died = np.full(len(self.agent_id), np.iinfo(np.int64).max)
+		tick_busy = np.zeros(len(self.agent_id), dtype=np.int64)
+		attack, resource = self.rules.attack, self.rules.resource
+		heapq.heapify(events)
+
+		while len(events):
+			tick, kind, row, row_other = heapq.heappop(events)
+
+			if min(tick_died[row], tick_died[row_other]) <= tick or tick in (tick_busy[row], tick_busy[row_other]):
+				continue
+
+			tick_busy[row] = tick_busy[row_other] = tick
+			rows = np.array([row, row_other])
+			energy = self.__get_energy(rows, n_moving, tick) + delta[rows]
+			self.n_events += 1
+
+			if kind == EventEngine.GATHER:
+				delta[row] += energy[1] * resource.gain_energy
+				self.team_resources[self.team[row]] += energy[1] * resource.gain_resource
+				tick_died[row_other] = tick
+				continue
+
+			energy_adjusted = energy * np.where(self.activity[rows] == Engine.HIT, 1 - attack.loss_energy_aggressive, 1)
+			winner, loser = (0, 1) if self.rng.random() * energy_adjusted.sum() < energy_adjusted[0] else (1, 0)
+			delta[rows[winner]] += energy_adjusted[winner] + energy_adjusted[loser] * attack.gain_energy_win - \
+				energy[winner]
+			self.team_resources[self.team[rows[winner]]] += energy_adjusted[loser] * attack.gain_resource_win
+			self.team_resources[self.team[rows[loser]]] -= energy_adjusted[loser] * attack.loss_resource_lose
+			tick_died[rows[loser]] = tick
+
+		return delta, tick_died
+
+	def _advance(self, n_ticks_max):
+		""" Runs the rest of the decision period """
+		if self.n_ticks % self.decision_period == 0:
+			self.decide()
+
+		n_ticks = min(n_ticks_max, self.decision_period - self.n_ticks % self.decision_period)
+		coord, energy = self.coord.copy(), self.energy.copy()
+		movement = self.rules.movement
+		is_alive = self.energy > 0
+		hitters = np.flatnonzero(is_alive & self.is_hitter)
+		resources = np.flatnonzero(is_alive & ~self.is_hitter)
+		activity = self.activity[hitters]
+
+		n_moving = np.zeros(len(self.agent_id), dtype=np.int64)
+		n_moving[hitters] = np.where(activity != Engine.IDLE,
+			np.minimum(n_ticks, np.floor(self.energy[hitters] / movement.loss_energy_moving)), 0)
+		rate = np.zeros(len(self.agent_id))  # Speed towards the target, negative, if running away from it
+		rate[hitters] = np.where(activity == Engine.RUN, -movement.speed,
+			np.where(activity != Engine.IDLE, movement.speed, 0))
+
+		# Hitters head for their earliest contacts, those having none - for the nearest targets
+		enemy, _ = self._get_nearest(hitters, hitters, enemies=True)
+		resource, _ = self._get_nearest(hitters, resources)
+		heading = np.full(len(self.agent_id), -1)
+		heading[hitters] = np.where(activity == Engine.TAKE, resource, enemy)
+		rows, rows_other, distance, kinds = self.__get_pairs(hitters, resources, n_ticks)
+		ticks = self.__get_contact_ticks(np.abs(rate[rows]), np.abs(rate[rows_other]), n_moving[rows],
+			n_moving[rows_other], distance, n_ticks)  # As if everybody was heading for everybody
+
+		for r, r_other in [(rows, rows_other,), (rows_other, rows,)]:
+			is_approaching = (ticks > 0) & (rate[r] > 0) & ((kinds == EventEngine.GATHER) == (self.activity[r] == Engine.TAKE))
+			order = np.lexsort((-distance[is_approaching], -ticks[is_approaching]))  # The earliest one is assigned last
+			heading[r[is_approaching][order]] = r_other[is_approaching][order]
+
+		ticks = self.__get_contact_ticks(rate[rows] * (heading[rows] == rows_other),
+			rate[rows_other] * (heading[rows_other] == rows), n_moving[rows], n_moving[rows_other], distance, n_ticks)
+		is_scheduled = ticks > 0
+		events = list(zip(ticks[is_scheduled].tolist(), kinds[is_scheduled].tolist(), rows[is_scheduled].tolist(),
+			rows_other[is_scheduled].tolist()))
+		n_scheduled = len(events)
+		delta, tick_died = self.__process(events, n_moving)
+
+		# Movers stop at the contact distance from their targets, or halfway there, if the targets head for them too
+		rows = hitters[heading[hitters] >= 0]
+		target = heading[rows]
+		direction = self.coord[target] - self.coord[rows]
+		distance = np.abs(direction).sum(axis=1)
+		direction /= np.maximum(distance, 1e-12)[:, None]
+		limit = np.maximum(distance - movement.speed, 0) * np.where((heading[target] == rows) & (rate[target] > 0), .5, 1)
+		n_moved = np.minimum(n_moving[rows], tick_died[rows])
+		step = np.where(rate[rows] < 0, -movement.speed * n_moved, np.minimum(movement.speed * n_moved, limit))
+		self.coord[rows] = np.clip(self.coord[rows] + direction * step[:, None], 0, self.world_dim)
+
+		changed = np.flatnonzero(is_alive)
+		self.energy[changed] = np.where(tick_died[changed] <= n_ticks, 0,
+			self.__get_energy(changed, n_moving, n_ticks) + delta[changed])
+		self._sync(coord, energy)
+		self.n_ticks += n_ticks
+
+		if __debug__:
+			Log.debug(self._advance, "tick:", self.n_ticks, "N scheduled:", n_scheduled, "N processed:", self.n_events)
+
+	def run(self, n_ticks):
+		""" See `Engine.run`. The result also has "n_events", the number of interactions processed """
+		n_events = self.n_events
+		res = super().run(n_ticks)
+		res["n_events"] = self.n_events - n_events
+
+		return res
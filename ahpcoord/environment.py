@@ -1,7 +1,12 @@
 from reasoning_model import *
 from ahpy.ahpy import ahpy
+import hashlib
+import os
 import pickle
 import random
+import itertools
+import math
+import struct
 from functools import reduce
 
 
@@ -50,30 +55,782 @@ class WorldFactory:
 	def gen_hitter(self, team_id=None):
 		return self.__generate_agent(Agent.Type.HITTER, team_id=team_id)
 
+	def gen_bulk(self, n_hitters, n_resources, seed=None):
+		"""
+		Generates agents at once, reproducibly. Hitters' teams and resources' teams are drawn from separate streams, and
+		each team's hitters, as well as the resources, get their coordinates and energies from a stream of their own, so
+		changing the number of resources does not affect the hitters, nor does a team's size affect the other teams.
+
+		:param seed: seed of `np.random.SeedSequence`, random, if None
+		:return: columns (ids, coordinates, energies, type codes, teams), see `AgentTable.add_columns`. Resources go
+		first
+		"""
+		n = n_resources + n_hitters
+		seeds = np.random.SeedSequence(seed).spawn(self.n_teams + 4)  # Hitters' teams, resources, teams, resources' teams
+		agent_id = np.arange(self.__id_bound, self.__id_bound + n, dtype=np.int64)
+		agent_type = np.repeat(np.array([Agent.Type.RESOURCE.value, Agent.Type.HITTER.value], dtype=np.int8),
+			[n_resources, n_hitters])
+		team = np.concatenate([np.random.default_rng(s).integers(0, self.n_teams, size=size, endpoint=True) for s, size in
+			[(seeds[-1], n_resources,), (seeds[0], n_hitters,)]]).astype(np.int32)
+		coord = np.zeros((n, len(self.world_dim)))
+		energy = np.zeros(n)
+		groups = [(np.arange(n_resources), seeds[1], self.resource_energy_mean, self.resource_energy_deviation,)]
+		groups += [(n_resources + np.flatnonzero(team[n_resources:] == t), seeds[2 + t], self.hitter_energy_mean,
+			self.hitter_energy_deviation,) for t in range(self.n_teams + 1)]
+
+		for rows, team_seed, mean, deviation in groups:
+			rng = np.random.default_rng(team_seed)
+			coord[rows] = rng.random((len(rows), len(self.world_dim))) * self.world_dim
+			energy[rows] = rng.normal(mean, deviation, size=len(rows))
+
+		self.__id_bound += n
+
+		return agent_id, coord, energy, agent_type, team
+
+	def populate(self, world, n_hitters, n_resources, seed=None):
+		""" Generates agents with `gen_bulk` and adds them to `world` """
+		world.add_columns(*self.gen_bulk(n_hitters, n_resources, seed))
+
+
+class AgentView:
+	""" Agent stored in an `AgentTable`. Reads and writes go straight to the table's columns """
+
+	__slots__ = ("table", "row")
+
+	TYPES = dict((t.value, t,) for t in Agent.Type)
+
+	def __init__(self, table, row):
+		self.table = table
+		self.row = row
+
+	@property
+	def id(self):
+		return int(self.table.id[self.row])
+
+	@property
+	def coord(self):
+		return self.table.coord[self.row]
+
+	@coord.setter
+	def coord(self, coord):
+		self.table.coord[self.row] = coord
+
+	@property
+	def energy(self):
+		return float(self.table.energy[self.row])
+
+	@energy.setter
+	def energy(self, energy):
+		self.table.energy[self.row] = energy
+
+	@property
+	def type(self):
+		return AgentView.TYPES[int(self.table.type[self.row])]
+
+	@property
+	def team(self):
+		team = int(self.table.team[self.row])
+		return None if team == AgentTable.NO_TEAM else team
+
+	def to_agent(self):
+		return Agent(id=self.id, coord=self.coord.tolist(), energy=self.energy, type=self.type, team=self.team)
+
+	def __eq__(self, other):
+		return isinstance(other, AgentView) and self.table is other.table and self.row == other.row
+
+	def __hash__(self):
+		return hash((id(self.table), self.row,))
+
+	def __repr__(self):
+		return repr(self.to_agent()).replace("Agent(", "AgentView(", 1)
+
+
+class AgentTable:
+	"""
+	Struct-of-arrays storage of agents: contiguous columns of ids, coordinates, energies, type codes, and teams. Behaves
+	as a read-only {id: agent} mapping that hands out `AgentView`s. Vectorized consumers may read the columns directly,
+	those are views over the first `len(table)` rows, not copies.
+	"""
+
+	NO_TEAM = -1
+
+	def __init__(self, n_dim=2, capacity=64):
+		self.__n = 0
+		self.__id = np.zeros(capacity, dtype=np.int64)
+		self.__coord = np.zeros((capacity, n_dim), dtype=float)
+		self.__energy = np.zeros(capacity, dtype=float)
+		self.__type = np.zeros(capacity, dtype=np.int8)
+		self.__team = np.zeros(capacity, dtype=np.int32)
+		self.__id_to_row = np.full(capacity, -1, dtype=np.int64)  # Ids are expected to be small non-negative integers
+		self.__team_rows = None  # team -> rows, built on demand
+		self.__type_rows = None  # type code -> rows, built on demand
+
+	@property
+	def id(self):
+		return self.__id[:self.__n]
+
+	@property
+	def coord(self):
+		return self.__coord[:self.__n]
+
+	@property
+	def energy(self):
+		return self.__energy[:self.__n]
+
+	@property
+	def type(self):
+		return self.__type[:self.__n]
+
+	@property
+	def team(self):
+		return self.__team[:self.__n]
+
+	@staticmethod
+	def __grow(column, size):
+		res = np.zeros((size,) + column.shape[1:], dtype=column.dtype)
+		res[:len(column)] = column
+
+		return res
+
+	def __reserve(self, n, agent_id_max):
+		if n > len(self.__id):
+			size = max(n, 2 * len(self.__id))
+			self.__id, self.__coord, self.__energy, self.__type, self.__team = [AgentTable.__grow(c, size) for c in
+				[self.__id, self.__coord, self.__energy, self.__type, self.__team]]
+
+		if agent_id_max >= len(self.__id_to_row):
+			id_to_row = np.full(max(agent_id_max + 1, 2 * len(self.__id_to_row)), -1, dtype=np.int64)
+			id_to_row[:len(self.__id_to_row)] = self.__id_to_row
+			self.__id_to_row = id_to_row
+
+	def add(self, agent: Agent):
+		""" Copies the agent into the table. Re-adding an id overwrites the row """
+		assert agent.id >= 0
+		row = self.get_row(agent.id)
+
+		if row is None:
+			self.__reserve(self.__n + 1, agent.id)
+			row = self.__n
+			self.__n += 1
+			self.__id_to_row[agent.id] = row
+
+		self.__id[row] = agent.id
+		self.__coord[row] = agent.coord
+		self.__energy[row] = agent.energy
+		self.__type[row] = agent.type.value
+		self.__team[row] = AgentTable.NO_TEAM if agent.team is None else agent.team
+		self.__team_rows = None
+		self.__type_rows = None
+
+		return AgentView(self, row)
+
+	def add_columns(self, agent_id, coord, energy, agent_type, team):
+		""" Bulk `add`. Takes columns shaped as the table's ones, `agent_type` holds type codes. Ids must be new """
+		agent_id = np.asarray(agent_id, dtype=np.int64)
+		n = len(agent_id)
+
+		if not n:
+			return
+
+		assert agent_id.min() >= 0
+		self.__reserve(self.__n + n, int(agent_id.max()))
+		assert (self.__id_to_row[agent_id] < 0).all()
+		rows = slice(self.__n, self.__n + n)
+		self.__id[rows] = agent_id
+		self.__coord[rows] = coord
+		self.__energy[rows] = energy
+		self.__type[rows] = agent_type
+		self.__team[rows] = team
+		self.__id_to_row[agent_id] = np.arange(self.__n, self.__n + n)
+		self.__n += n
+		self.__team_rows = None
+		self.__type_rows = None
+
+	def adopt(self, agent_id, coord, energy, agent_type, team):
+		"""
+		Takes the columns over as the table's storage, without copying them, e.g. to keep working on a memory map.
+		The table must be empty. Columns get copied once the table grows
+		"""
+		assert not self.__n
+		agent_id = np.asarray(agent_id)
+		self.__id_to_row[:] = -1
+		self.__reserve(0, int(agent_id.max()) if len(agent_id) else -1)
+		self.__id, self.__coord, self.__energy, self.__type, self.__team = agent_id, coord, energy, agent_type, team
+		self.__id_to_row[agent_id] = np.arange(len(agent_id))
+		self.__n = len(agent_id)
+		self.__team_rows = None
+		self.__type_rows = None
+
+	def clear(self):
+		self.__id_to_row[self.id] = -1
+		self.__n = 0
+		self.__team_rows = None
+		self.__type_rows = None
+
+	def get_row(self, agent_id):
+		if 0 <= agent_id < len(self.__id_to_row) and self.__id_to_row[agent_id] >= 0:
+			return int(self.__id_to_row[agent_id])
+
+		return None
+
+	def get_rows(self, agent_ids):
+		""" Rows of agents, vectorized. Every id must be present """
+		return self.__id_to_row[np.asarray(agent_ids, dtype=np.int64)]
+
+	@staticmethod
+	def __group_rows(keys):
+		order = np.argsort(keys, kind="stable")
+		values, begins = np.unique(keys[order], return_index=True)
+
+		return dict(zip(values.tolist(), np.split(order, begins[1:])))
+
+	def get_team_rows(self, team):
+		""" Rows of the team's agents, in the order they have been added """
+		if self.__team_rows is None:
+			self.__team_rows = AgentTable.__group_rows(self.team)
+
+		return self.__team_rows.get(AgentTable.NO_TEAM if team is None else team, np.zeros(0, dtype=np.int64))
+
+	def get_type_rows(self, agent_type: Agent.Type):
+		""" Rows of the agents of a type, in the order they have been added """
+		if self.__type_rows is None:
+			self.__type_rows = AgentTable.__group_rows(self.type)
+
+		return self.__type_rows.get(agent_type.value, np.zeros(0, dtype=np.int64))
+
+	def get_views(self, rows):
+		return [AgentView(self, r) for r in rows.tolist()]
+
+	def get(self, agent_id, default=None):
+		row = self.get_row(agent_id)
+
+		return default if row is None else AgentView(self, row)
+
+	def __getitem__(self, agent_id):
+		row = self.get_row(agent_id)
+
+		if row is None:
+			raise KeyError(agent_id)
+
+		return AgentView(self, row)
+
+	def __contains__(self, agent_id):
+		return self.get_row(agent_id) is not None
+
+	def __len__(self):
+		return self.__n
+
+	def keys(self):
+		return self.id.tolist()
+
+	def values(self):
+		return self.get_views(np.arange(self.__n))
+
+	def items(self):
+		return zip(self.keys(), self.values())
+
+
+class WorldFile:
+	"""
+	Versioned binary columnar world format. The file is a fixed header, a table of teams' row ranges, and the
+	`AgentTable` columns, each aligned to `ALIGNMENT` bytes. Rows are sorted by team. Columns are memory-mapped
+	copy-on-write, so parts of a world can be read without loading the rest, and writes to them never reach the file.
+	"""
+
+	MAGIC = b"AHPW"
+	VERSION = 1
+	HEADER = struct.Struct("<4sIQII")  # Magic, version, N agents, N coordinates, N teams
+	TEAM = np.dtype([("team", "<i4"), ("begin", "<i8"), ("end", "<i8")])
+	COLUMNS = [("id", "<i8"), ("coord", "<f8"), ("energy", "<f8"), ("type", "<i1"), ("team", "<i4")]
+	ALIGNMENT = 64
+
+	def __init__(self, filename):
+		self.filename = filename
+
+		with open(filename, 'rb') as f:
+			magic, version, self.n_agents, self.n_dim, n_teams = WorldFile.HEADER.unpack(f.read(WorldFile.HEADER.size))
+
+		if magic != WorldFile.MAGIC:
+			raise ValueError(f"{filename} is not a world file")
+
+		if version != WorldFile.VERSION:
+			raise ValueError(f"{filename}: unsupported world file version {version}")
+
+		offset = WorldFile.HEADER.size
+		teams = np.fromfile(filename, dtype=WorldFile.TEAM, count=n_teams, offset=offset)
+		self.__team_rows = dict((int(t["team"]), (int(t["begin"]), int(t["end"]),)) for t in teams)
+		offset += WorldFile.TEAM.itemsize * n_teams
+		self.columns = dict()
+
+		for name, shape, dtype in WorldFile.__layout(self.n_agents, self.n_dim):
+			offset = WorldFile.__align(offset)
+			self.columns[name] = np.memmap(filename, dtype=dtype, mode='c', offset=offset, shape=shape) if \
+				self.n_agents else np.zeros(shape, dtype=dtype)
+			offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+	@staticmethod
+	def __align(offset):
+		return -(-offset // WorldFile.ALIGNMENT) * WorldFile.ALIGNMENT
+
+	@staticmethod
+	def __layout(n_agents, n_dim):
+		for name, dtype in WorldFile.COLUMNS:
+			yield name, (n_agents, n_dim) if name == "coord" else (n_agents,), dtype
+
+	@staticmethod
+	def is_world_file(filename):
+		with open(filename, 'rb') as f:
+			return f.read(len(WorldFile.MAGIC)) == WorldFile.MAGIC
+
+	@staticmethod
+	def write(filename, table: AgentTable):
+		order = np.argsort(table.team, kind="stable")
+		team = table.team[order]
+		values, begins = np.unique(team, return_index=True)
+		teams = np.zeros(len(values), dtype=WorldFile.TEAM)
+		teams["team"] = values
+		teams["begin"] = begins
+		teams["end"] = np.append(begins[1:], len(team))
+
+		with open(filename, 'wb') as f:
+			f.write(WorldFile.HEADER.pack(WorldFile.MAGIC, WorldFile.VERSION, len(table), table.coord.shape[1],
+				len(teams)))
+			f.write(teams.tobytes())
+
+			for name, shape, dtype in WorldFile.__layout(len(table), table.coord.shape[1]):
+				f.write(b"\0" * (WorldFile.__align(f.tell()) - f.tell()))
+				f.write(np.ascontiguousarray(getattr(table, name)[order], dtype=dtype).tobytes())
+
+	def get_teams(self):
+		return list(self.__team_rows.keys())
+
+	def select(self, team_ids=None, region=None):
+		"""
+		:param team_ids: teams to read, all, if None. Only the teams' row ranges get touched
+		:param region: (lower coordinates, upper coordinates), the box agents should be inside of, lower bound included
+		:return: rows of the agents selected
+		"""
+		if team_ids is None:
+			rows = np.arange(self.n_agents)
+		else:
+			rows = np.concatenate([np.arange(*self.__team_rows[t]) for t in team_ids if t in self.__team_rows] +
+				[np.zeros(0, dtype=np.int64)])
+
+		if region is not None:
+			coord = self.columns["coord"][rows]
+			rows = rows[((coord >= region[0]) & (coord < region[1])).all(axis=1)]
+
+		return rows
+
+	def read(self, rows):
+		"""
+		Columns of the rows selected, in the order `AgentTable.add_columns` takes them. A contiguous range of rows, e.g.
+		a whole team, is returned as views onto the memory maps, other selections get copied
+		"""
+		if len(rows) and rows[-1] - rows[0] + 1 == len(rows) and (np.diff(rows) == 1).all():
+			rows = slice(int(rows[0]), int(rows[-1]) + 1)
+
+		return tuple(self.columns[name][rows] for name, _ in WorldFile.COLUMNS)
+
+
+class SpatialIndex:
+	""" Uniform grid over agents' coordinates """
+
+	def __init__(self, cell_size: float):
+		self.cell_size = cell_size
+		self.__cells = dict()  # Cell key -> {agent id: agent}
+		self.__id_to_cell = dict()
+
+	def get_cell(self, coord):
+		return tuple(int(math.floor(c / self.cell_size)) for c in coord)
+
+	def add(self, agent: Agent):
+		key = self.get_cell(agent.coord)
+		self.__cells.setdefault(key, dict())[agent.id] = agent
+		self.__id_to_cell[agent.id] = key
+
+	def remove(self, agent: Agent):
+		key = self.__id_to_cell.pop(agent.id)
+		del self.__cells[key][agent.id]
+
+		if not len(self.__cells[key]):
+			del self.__cells[key]
+
+	def update(self, agent: Agent):
+		""" Re-indexes an agent after its coordinates have changed """
+		if self.__id_to_cell.get(agent.id) != self.get_cell(agent.coord):
+			self.remove(agent)
+			self.add(agent)
+
+	def update_many(self, agent_ids, coord):
+		""" Bulk `update`, only agents that have changed their cells get re-indexed """
+		keys = map(tuple, np.floor(np.asarray(coord) / self.cell_size).astype(np.int64).tolist())
+
+		for agent_id, key in zip(agent_ids, keys):
+			key_old = self.__id_to_cell[agent_id]
+
+			if key != key_old:
+				agent = self.__cells[key_old].pop(agent_id)
+
+				if not len(self.__cells[key_old]):
+					del self.__cells[key_old]
+
+				self.__cells.setdefault(key, dict())[agent_id] = agent
+				self.__id_to_cell[agent_id] = key
+
+	def clear(self):
+		self.__cells.clear()
+		self.__id_to_cell.clear()
+
+	def query_cells(self, key, n_cells):
+		""" Agents from cells within `n_cells` of cell `key` along each dimension """
+		res = []
+
+		for offset in itertools.product(range(-n_cells, n_cells + 1), repeat=len(key)):
+			cell = self.__cells.get(tuple(k + o for k, o in zip(key, offset)))
+
+			if cell is not None:
+				res.extend(cell.values())
+
+		return res
+
+	def query(self, coord, radius):
+		""" Agents within Manhattan `radius` of `coord` """
+		candidates = self.query_cells(self.get_cell(coord), int(math.ceil(radius / self.cell_size)))
+
+		return [a for a in candidates if sum(abs(c - co) for c, co in zip(coord, a.coord)) <= radius]
+
+
+class TableIndex:
+	"""
+	Uniform grid over the rows of an `AgentTable`, a counterpart of `SpatialIndex` which keeps no per-agent objects.
+	Cells are numbered within the bounding box of the agents, rows are kept sorted by their cells' numbers, and
+	`AgentView`s are only made for the agents queried. The sorting is redone on the next query after any agent has been
+	added, or has changed its cell
+	"""
+
+	def __init__(self, cell_size: float, table: AgentTable):
+		self.cell_size = cell_size
+		self.__table = table
+		self.__low = None  # Lowest cell key of the bounding box
+		self.__shape = None  # Number of cells of the bounding box along each dimension
+		self.__codes = None  # Cell numbers of the rows, as of the last sorting
+		self.__order = None  # Rows sorted by their cell numbers
+		self.__cells = None  # Sorted numbers of non-empty cells. None, if stale
+		self.__ranges = None  # Their (begin, end) positions in `__order` shaped (cells, 2)
+		self.__offsets = dict()  # N cells -> offsets of the cells within that many cells
+
+	def get_cell(self, coord):
+		return tuple(int(math.floor(c / self.cell_size)) for c in coord)
+
+	def __get_codes(self, keys):
+		""" Numbers of cells `keys` shaped (N, dimensions), -1 for those off the bounding box """
+		keys = keys - self.__low
+		is_inside = ((keys >= 0) & (keys < self.__shape)).all(axis=1)
+		codes = np.full(len(keys), -1, dtype=np.int64)
+		codes[is_inside] = np.ravel_multi_index(tuple(keys[is_inside].T), self.__shape)
+
+		return codes
+
+	def __get_keys(self, coord):
+		return np.floor(np.asarray(coord, dtype=float) / self.cell_size).astype(np.int64).reshape(-1,
+			self.__table.coord.shape[1])
+
+	def __sort(self):
+		keys = self.__get_keys(self.__table.coord)
+		self.__low = keys.min(axis=0) if len(keys) else np.zeros(keys.shape[1], dtype=np.int64)
+		self.__shape = tuple((keys.max(axis=0) - self.__low + 1).tolist()) if len(keys) else (1,) * keys.shape[1]
+		self.__codes = self.__get_codes(keys)
+		self.__order = np.argsort(self.__codes, kind="stable")
+		self.__cells, begins = np.unique(self.__codes[self.__order], return_index=True)
+		bounds = np.append(begins, len(self.__order))
+		self.__ranges = np.stack([bounds[:-1], bounds[1:]], axis=1)
+
+	def add(self, agent: AgentView):
+		self.__cells = None
+
+	def add_many(self, agent_ids, coord):
+		self.__cells = None
+
+	def update(self, agent: AgentView):
+		""" Re-sorts the rows on the next query, if the agent has changed its cell """
+		if self.__cells is not None and self.__get_codes(self.__get_keys(agent.coord))[0] != self.__codes[agent.row]:
+			self.__cells = None
+
+	def update_many(self, agent_ids, coord):
+		""" Bulk `update`, cells are compared at once """
+		if self.__cells is not None and len(agent_ids):
+			if (self.__get_codes(self.__get_keys(coord)) != self.__codes[self.__table.get_rows(agent_ids)]).any():
+				self.__cells = None
+
+	def clear(self):
+		self.__cells = None
+
+	def query_rows(self, key, n_cells):
+		""" Rows from cells within `n_cells` of cell `key` along each dimension """
+		if self.__cells is None:
+			self.__sort()
+
+		offsets = self.__offsets.get(n_cells)
+
+		if offsets is None:
+			offsets = np.array(list(itertools.product(range(-n_cells, n_cells + 1), repeat=len(key))), dtype=np.int64)
+			self.__offsets[n_cells] = offsets
+
+		codes = self.__get_codes(np.asarray(key, dtype=np.int64) + offsets)
+		codes = codes[codes >= 0]
+		i = np.minimum(np.searchsorted(self.__cells, codes), len(self.__cells) - 1)
+		ranges = self.__ranges[i[self.__cells[i] == codes]].tolist() if len(self.__cells) else []
+
+		return np.concatenate([self.__order[b:e] for b, e in ranges] + [np.zeros(0, dtype=np.int64)])
+
+	def query_cells(self, key, n_cells):
+		""" Agents from cells within `n_cells` of cell `key` along each dimension """
+		return self.__table.get_views(self.query_rows(key, n_cells))
+
+	def query(self, coord, radius):
+		""" Agents within Manhattan `radius` of `coord` """
+		rows = self.query_rows(self.get_cell(coord), int(math.ceil(radius / self.cell_size)))
+		rows = rows[np.abs(self.__table.coord[rows] - np.asarray(coord, dtype=float)).sum(axis=1) <= radius]
+
+		return self.__table.get_views(rows)
+
+
+class DistanceCache:
+	"""
+	Lazily evaluated Manhattan distances b/w agents. Small worlds get a dense matrix, big ones - a dict of pairs. Each
+	entry is stamped with versions of the agents' coordinates, so a move only invalidates distances of the agent moved.
+	An `AgentTable` has the coordinates at hand, so its distances are computed on each request, and nothing is kept.
+	"""
+
+	DENSE_MAX = 2048  # Max. number of agents for the dense matrix
+	SPARSE_MAX = 1 << 22  # Max. number of pairs kept in the dict before it gets flushed
+
+	def __init__(self, id_to_agent: dict):
+		"""
+		:param id_to_agent: the world's agents, a dict or an `AgentTable`. The cache has to be notified of any change
+		through `add`, `invalidate`, or `clear`
+		"""
+		self.__id_to_agent = id_to_agent
+		self.__table = id_to_agent if isinstance(id_to_agent, AgentTable) else None
+		self.__coord_version = dict()
+		self.__rows = None  # id -> row of the dense matrix
+		self.__coord = None
+		self.__matrix = None
+		self.__row_version = None
+		self.__pairs = dict()  # (id, id other) -> (distance, coord version, coord version other)
+
+	def add(self, agent: Agent):
+		if self.__table is None:
+			self.__rows = None  # The dense matrix gets rebuilt on demand
+			self.invalidate(agent.id)
+
+	def invalidate(self, agent_id):
+		""" The agent's coordinates have changed """
+		if self.__table is None:
+			self.__coord_version[agent_id] = self.__coord_version.get(agent_id, 0) + 1
+
+	def invalidate_many(self, agent_ids):
+		if self.__table is None:
+			self.__coord_version.update((i, self.__coord_version.get(i, 0) + 1,) for i in agent_ids)
+
+	def clear(self):
+		self.__coord_version.clear()
+		self.__rows = None
+		self.__pairs.clear()
+
+	def __build(self):
+		agents = list(self.__id_to_agent.values())
+		self.__rows = dict((a.id, i,) for i, a in enumerate(agents))
+		self.__coord = np.array([a.coord for a in agents], dtype=float)
+		self.__matrix = np.abs(self.__coord[:, None, :] - self.__coord[None, :, :]).sum(axis=2)
+		self.__row_version = [self.__coord_version[a.id] for a in agents]
+
+	def __refresh(self, agent_id, row):
+		self.__coord[row] = self.__id_to_agent[agent_id].coord
+		distances = np.abs(self.__coord - self.__coord[row]).sum(axis=1)
+		self.__matrix[row, :] = distances
+		self.__matrix[:, row] = distances
+		self.__row_version[row] = self.__coord_version[agent_id]
+
+	def __get_dense(self, agent, agent_other):
+		if self.__rows is None:
+			self.__build()
+
+		row = self.__rows[agent.id]
+		row_other = self.__rows[agent_other.id]
+
+		for agent_id, r in [(agent.id, row,), (agent_other.id, row_other,)]:
+			if self.__row_version[r] != self.__coord_version[agent_id]:
+				self.__refresh(agent_id, r)
+
+		return self.__matrix.item((row, row_other))
+
+	def __get_sparse(self, agent, agent_other):
+		key = (agent.id, agent_other.id) if agent.id < agent_other.id else (agent_other.id, agent.id)
+		version = (self.__coord_version[key[0]], self.__coord_version[key[1]])
+		cached = self.__pairs.get(key)
+
+		if cached is not None and cached[1:] == version:
+			return cached[0]
+
+		if len(self.__pairs) >= DistanceCache.SPARSE_MAX:
+			self.__pairs.clear()
+
+		distance = sum(abs(c - c_other) for c, c_other in zip(agent.coord, agent_other.coord))
+		self.__pairs[key] = (distance,) + version
+
+		return distance
+
+	def __is_member(self, agent):
+		member = self.__id_to_agent.get(agent.id)
+
+		return member is agent or isinstance(member, AgentView) and member == agent
+
+	def get(self, agent, agent_other):
+		if not self.__is_member(agent) or not self.__is_member(agent_other):
+			# Not a part of the world
+			return sum(abs(c - c_other) for c, c_other in zip(agent.coord, agent_other.coord))
+		elif self.__table is not None:
+			return float(np.abs(self.__table.coord[agent.row] - self.__table.coord[agent_other.row]).sum())
+		elif len(self.__id_to_agent) <= DistanceCache.DENSE_MAX:
+			return self.__get_dense(agent, agent_other)
+		else:
+			return self.__get_sparse(agent, agent_other)
+
 
 class World:
 
-	def __init__(self):
+	def __init__(self, cell_size=1.0, columnar=False, n_dim=2):
+		"""
+		:param cell_size: cell size of the spatial index. Neighbourhood queries are the cheapest when it is about the
+		size of a typical query radius
+		:param columnar: keep agents in an `AgentTable`. Agents get copied on `add_agent`, and the world hands out
+		`AgentView`s over the table
+		:param n_dim: number of coordinates, only used by the columnar storage
+		"""
 		self.__team_to_agents = dict()
-		self.__id_to_agent = dict()
+		self.__table = AgentTable(n_dim) if columnar else None
+		self.__id_to_agent = dict() if self.__table is None else self.__table
 		self.__resources = list()
+		self.__index = SpatialIndex(cell_size) if self.__table is None else TableIndex(cell_size, self.__table)
+		self.__distances = DistanceCache(self.__id_to_agent)
+		self.__dirty = dict()  # Agent id -> its coordinates as of the last `pop_dirty`. Columnar worlds keep arrays:
+		self.__dirty_rows = np.zeros(0, dtype=bool)  # Whether a row has changed since the last `pop_dirty`
+		self.__dirty_coord = np.zeros((0, n_dim))  # Coordinates of the rows as of then
+
+	def save(self, filename, binary=False):
+		"""
+		:param binary: use the memory-mappable `WorldFile` format instead of pickle
+		"""
+		temporary = f"{filename}.{os.getpid()}.tmp"  # The world may be memory-mapped onto `filename`, which is replaced
+
+		if binary:
+			table = self.__table
+
+			if table is None:
+				table = AgentTable(n_dim=len(next(iter(self.__id_to_agent.values())).coord) if
+					len(self.__id_to_agent) else 2)
+
+				for agent in self.__id_to_agent.values():
+					table.add(agent)
+
+			WorldFile.write(temporary, table)
+		else:
+			with open(temporary, 'wb') as f:
+				pickle.dump(dict((i, a if self.__table is None else a.to_agent(),) for i, a in
+					self.__id_to_agent.items()), f)
+
+		os.replace(temporary, filename)
 
-	def save(self, filename):
-		pickle.dump(self.__id_to_agent, open(filename, 'wb'))
+	def get_table(self) -> AgentTable or None:
+		""" Columnar storage, if the world has been created with one """
+		return self.__table
 
-	def load(self, filename):
+	def load(self, filename, team_ids=None, region=None):
+		"""
+		Replaces the world's agents with those from a file. Both pickled and `WorldFile` worlds are accepted. An empty
+		columnar world keeps working on the `WorldFile`'s memory maps, where a contiguous range of rows gets loaded
+
+		:param team_ids: only load agents of these teams
+		:param region: only load agents inside of a box, see `WorldFile.select`
+		"""
 		self.__team_to_agents.clear()
 		self.__id_to_agent.clear()
 		self.__resources.clear()
+		self.__index.clear()
+		self.__distances.clear()
+		self.__dirty.clear()
+		self.__dirty_rows[:] = False
+
+		if WorldFile.is_world_file(filename):
+			self.__load_binary(WorldFile(filename), team_ids, region)
+			return
 
 		loaded = pickle.load(open(filename, 'rb'))
 		Log.debug(self.load, "loading agents", loaded.values())
 
 		for agent in loaded.values():
-			self.add_agent(agent)
+			if (team_ids is None or agent.team in team_ids) and (region is None or
+					all(lo <= c < hi for c, lo, hi in zip(agent.coord, *region))):
+				self.add_agent(agent)
+
+	def __load_binary(self, world_file: WorldFile, team_ids, region):
+		columns = world_file.read(world_file.select(team_ids, region))
+		Log.debug(self.load, "loading", len(columns[0]), "agents from", world_file.filename)
+		self.add_columns(*columns, adopt=self.__table is not None and not len(self.__table))
+
+	def add_columns(self, agent_id, coord, energy, agent_type, team, adopt=False):
+		"""
+		Bulk `add_agent`, takes what `AgentTable.add_columns` does. Columnar worlds copy the columns at once
+
+		:param adopt: columnar worlds keep the columns as the storage instead, see `AgentTable.adopt`
+		"""
+		columns = [np.asarray(c) for c in [agent_id, coord, energy, agent_type, team]]
+
+		if adopt:
+			self.__table.adopt(*columns)
+			self.__mark_dirty(np.arange(len(self.__table)))
+			self.__index.add_many(columns[0], self.__table.coord)
+		elif self.__table is None:
+			for i, c, e, t, team_id in zip(*[c.tolist() for c in columns]):
+				self.add_agent(Agent(id=i, coord=c, energy=e, type=AgentView.TYPES[t],
+					team=None if team_id == AgentTable.NO_TEAM else team_id))
+		else:
+			n = len(self.__table)
+			self.__table.add_columns(*columns)
+			self.__mark_dirty(np.arange(n, len(self.__table)))
+			self.__index.add_many(columns[0], self.__table.coord[n:])
+
+	def __mark_dirty(self, rows):
+		""" Columnar counterpart of `__dirty`: remembers the coordinates of those `rows` which are not dirty yet """
+		if len(self.__dirty_rows) < len(self.__table):
+			size = max(len(self.__table), 2 * len(self.__dirty_rows))
+			self.__dirty_rows = np.concatenate([self.__dirty_rows, np.zeros(size - len(self.__dirty_rows), dtype=bool)])
+			self.__dirty_coord = np.concatenate([self.__dirty_coord, np.zeros((size - len(self.__dirty_coord),) +
+				self.__dirty_coord.shape[1:])])
+
+		rows = rows[~self.__dirty_rows[rows]]
+		self.__dirty_coord[rows] = self.__table.coord[rows]
+		self.__dirty_rows[rows] = True
 
 	def add_agent(self, agent: Agent):
+		if self.__table is not None:
+			row = self.__table.get_row(agent.id)
+
+			if row is not None:
+				self.__mark_dirty(np.array([row]))
+
+			view = self.__table.add(agent)
+			self.__mark_dirty(np.array([view.row]))
+			self.__index.add(view)
+			self.__distances.add(agent)
+			return  # Teams and types are indexed by the table
+
+		self.__dirty.setdefault(agent.id, tuple(agent.coord))
 		self.__id_to_agent[agent.id] = agent
+		self.__index.add(agent)
+		self.__distances.add(agent)
 
 		if agent.type == Agent.Type.RESOURCE:
 			self.__resources.append(agent)
@@ -87,15 +844,151 @@ class World:
 	def get_agent(self, team_id=None, agent_id=None) -> list or Agent or None:
 		assert (team_id is None) != (agent_id is None)
 
+		if self.__table is not None and team_id is not None:
+			rows = self.__table.get_team_rows(team_id)
+			rows = rows[self.__table.type[rows] == Agent.Type.HITTER.value]
+
+			return self.__table.get_views(rows) if len(rows) else None
+
 		if team_id is not None:
 			return self.__team_to_agents[team_id] if team_id in self.__team_to_agents else None
 		elif agent_id is not None:
 			return self.__id_to_agent[agent_id] if agent_id in self.__id_to_agent else None
 
 	def get_resources(self):
+		if self.__table is not None:
+			return self.__table.get_views(self.__table.get_type_rows(Agent.Type.RESOURCE))
+
 		return self.__resources
 
+	def update_agent(self, agent_id, coord=None, energy=None):
+		""" The agents' state should only be changed through this method, so the world's indices stay consistent """
+		agent = self.__id_to_agent[agent_id]
+
+		if self.__table is None:
+			self.__dirty.setdefault(agent_id, tuple(agent.coord))
+		else:
+			self.__mark_dirty(np.array([agent.row]))
+
+		if energy is not None:
+			agent.energy = energy
+
+		if coord is not None:
+			agent.coord = coord
+			self.__index.update(agent)
+			self.__distances.invalidate(agent_id)
+
+	def update_agents(self, agent_ids, coord=None, energy=None):
+		"""
+		Bulk `update_agent`. Columnar worlds get their columns written at once, others - their agents' fields. Either
+		way, the index gets updated for the agents that have changed their cells only.
+
+		:param coord: new coordinates shaped (agents, dimensions)
+		:param energy: new energies shaped (agents,)
+		"""
+		agent_ids = np.asarray(agent_ids).tolist()
+
+		if self.__table is None:
+			agents = [self.__id_to_agent[i] for i in agent_ids]
+			self.__dirty.update((i, tuple(a.coord),) for i, a in zip(agent_ids, agents) if i not in self.__dirty)
+
+			if energy is not None:
+				for agent, e in zip(agents, np.asarray(energy, dtype=float).tolist()):
+					agent.energy = e
+
+			if coord is not None:
+				for agent, c in zip(agents, np.asarray(coord, dtype=float).tolist()):
+					agent.coord = c
+		else:
+			rows = self.__table.get_rows(agent_ids)
+			self.__mark_dirty(rows)
+
+			if energy is not None:
+				self.__table.energy[rows] = energy
+
+			if coord is not None:
+				self.__table.coord[rows] = coord
+
+		if coord is not None:
+			self.__index.update_many(agent_ids, coord)
+			self.__distances.invalidate_many(agent_ids)
+
+	def get_columns(self):
+		"""
+		(ids, coordinates, energies, type codes, teams) of every agent, see `AgentTable`. A columnar world returns views
+		of its columns, which should not be written to directly, see `update_agents`
+		"""
+		if self.__table is not None:
+			return self.__table.id, self.__table.coord, self.__table.energy, self.__table.type, self.__table.team
+
+		agents = list(self.__id_to_agent.values())
+
+		return np.array([a.id for a in agents], dtype=np.int64), \
+			np.array([a.coord for a in agents], dtype=float).reshape(len(agents), -1), \
+			np.array([a.energy for a in agents], dtype=float), \
+			np.array([a.type.value for a in agents], dtype=np.int8), \
+			np.array([AgentTable.NO_TEAM if a.team is None else a.team for a in agents], dtype=np.int32)
+
+	def get_digest(self):
+		""" Content hash of the agents. It does not depend on the storage, or on the order the agents were added in """
+		ids, coord, energy, types, team = self.get_columns()
+		order = np.argsort(ids, kind="stable")
+		digest = hashlib.sha256(str(coord.shape).encode())
+
+		for column, dtype in zip([ids, coord, energy, types, team], ["<i8", "<f8", "<f8", "<i1", "<i4"]):
+			digest.update(np.ascontiguousarray(column[order], dtype=dtype).tobytes())
+
+		return digest.hexdigest()
+
+	def pop_dirty(self):
+		"""
+		Agents added or updated since the previous call.
+
+		:return: (ids, coordinates as of the previous call, current coordinates) of the agents, shaped (agents,) and
+		(agents, dimensions)
+		"""
+		if self.__table is not None:
+			rows = np.flatnonzero(self.__dirty_rows[:len(self.__table)])
+			self.__dirty_rows[rows] = False
+
+			return self.__table.id[rows], self.__dirty_coord[rows], self.__table.coord[rows]
+
+		agent_ids = np.array(list(self.__dirty.keys()), dtype=np.int64)
+		n_dim = -1 if len(agent_ids) else 0
+		coord_before = np.array(list(self.__dirty.values()), dtype=float).reshape(len(agent_ids), n_dim)
+		coord = np.array([self.__id_to_agent[i].coord for i in self.__dirty.keys()], dtype=float).reshape(
+			len(agent_ids), n_dim)
+		self.__dirty.clear()
+
+		return agent_ids, coord_before, coord
+
+	def get_distance(self, agent: Agent, agent_other: Agent):
+		""" Manhattan distance b/w agents, cached """
+		return self.__distances.get(agent, agent_other)
+
+	def get_agents_near(self, coord, radius):
+		""" Agents within Manhattan `radius` of `coord` """
+		return self.__index.query(coord, radius)
+
+	def get_neighbourhoods(self, agents, radius):
+		"""
+		Splits `agents` into spatially compact groups. Yields (group, agents within `radius` of any agent from the
+		group, plus, possibly, some more)
+		"""
+		groups = dict()
+
+		for agent in agents:
+			groups.setdefault(self.__index.get_cell(agent.coord), []).append(agent)
+
+		n_cells = int(math.ceil(radius / self.__index.cell_size))
+
+		for key, group in groups.items():
+			yield group, self.__index.query_cells(key, n_cells)
+
 	def calc_teams(self):
+		if self.__table is not None:
+			return len(np.unique(self.__table.team[self.__table.type == Agent.Type.HITTER.value]))
+
 		return len(self.__team_to_agents.keys())
 
 	def calc_agents(self):
@@ -1,7 +1,19 @@
 import logging
 import pathlib
 import os
+import stat
 import inspect
+import re
+
+
+def _is_path(arg: str):
+	""" Whether `arg` names an existing file or directory. A single `stat` call, where `isfile or isdir` make two """
+	try:
+		mode = os.stat(arg).st_mode
+	except (OSError, ValueError):
+		return False
+
+	return stat.S_ISREG(mode) or stat.S_ISDIR(mode)
 
 
 class Log:
@@ -11,6 +23,19 @@ class Log:
 
 	_filter_pass = set()
 	_filter_kick = set()
+	_filter_kick_re = None  # Compiled from `_filter_kick`
+
+	class LazyFmt:
+		""" Postpones `Log.fmt` until the message actually gets emitted """
+
+		__slots__ = ("args", "kwargs",)
+
+		def __init__(self, args, kwargs):
+			self.args = args
+			self.kwargs = kwargs
+
+		def __str__(self):
+			return Log.fmt(*self.args, **self.kwargs)
 
 	@staticmethod
 	def logger():
@@ -31,33 +56,59 @@ class Log:
 	def filter(fkick=set(), fpass=set()):
 		Log._filter_kick.update(fkick)
 		Log._filter_pass.update(fpass)
+		Log.__compile_filters()
 
 	@staticmethod
 	def filter_reset():
 		Log._filter_pass.clear()
 		Log._filter_kick.clear()
+		Log.__compile_filters()
 
 	@staticmethod
-	def __wrap(method, *args, **kwargs):
+	def __compile_filters():
+		Log._filter_kick_re = re.compile('|'.join(map(re.escape, Log._filter_kick))) if len(Log._filter_kick) else None
+
+	@staticmethod
+	def __wrap(level, *args, **kwargs):
+		logger = Log._logger if Log._logger is not None else Log.logger()
+
+		if not logger.isEnabledFor(level):
+			return  # Nothing gets formatted
+
+		if not len(Log._filter_pass) and Log._filter_kick_re is None:
+			return logger.log(level, Log.LazyFmt(args, kwargs))
+
 		fmt = Log.fmt(*args, **kwargs)
 
-		for p in Log._filter_pass:
-			if not fmt.find(p) >= 0:
-				return
+		if not all(p in fmt for p in Log._filter_pass):
+			return
 
-		for k in Log._filter_kick:
-			if fmt.find(k) >= 0:
-				return
+		if Log._filter_kick_re is not None and Log._filter_kick_re.search(fmt):
+			return
 
-		return getattr(Log.logger(), method)(fmt)
+		return logger.log(level, fmt)
 
 	@staticmethod
-	def debug(*args, **kwargs):
-		return Log.__wrap("debug", *args, **kwargs)
+	def __noop(*args, **kwargs):
+		pass
+
+	@staticmethod
+	def __debug(*args, **kwargs):
+		return Log.__wrap(logging.DEBUG, *args, **kwargs)
+
+	debug = __debug  # Gets replaced with a no-op in the hot path mode
 
 	@staticmethod
 	def info(*args, **kwargs):
-		return Log.__wrap("info", *args, **kwargs)
+		return Log.__wrap(logging.INFO, *args, **kwargs)
+
+	@staticmethod
+	def set_hot_path(enable=True):
+		"""
+		In the hot path mode `debug` does nothing at all. Calls placed under `if __debug__:` get compiled out entirely
+		when running `python -O`
+		"""
+		Log.debug = Log.__noop if enable else Log.__debug
 
 	@staticmethod
 	def fmt(*args, **kwargs):
@@ -78,7 +129,7 @@ class Log:
 		def is_path(arg):
 			if type(arg) is not str:
 				return False
-			return os.path.isfile(arg) or os.path.isdir(arg)
+			return _is_path(arg)
 
 		def format_path(arg):
 			return pathlib.Path(arg).stem
@@ -0,0 +1,173 @@
+from reasoning_model import *
+import functools
+import importlib
+import json
+import time
+
+
+class Instrumentation:
+	"""
+	Opt-in call counting and timing of the hot paths. `enable` wraps the methods of `RulesInterp`, `ReasoningModel`
+	and `Simulation`, `disable` puts the originals back, so a disabled instrumentation costs nothing.
+
+	Timings are wall, and inclusive of nested instrumented calls. Process pool workers (`Simulation(n_workers=...)`)
+	keep their own counters, which are not collected.
+	"""
+
+	_calls = dict()  # "Class.method" -> [N calls, total time, max. time]
+	_created = dict()  # Class name -> N instances created
+	_runs = []  # Snapshots of what each `Simulation.run` took
+	_originals = []  # (class, attribute, original)
+
+	@staticmethod
+	def __get_targets():
+		simulation = importlib.import_module("simulation")
+
+		return [
+			(RulesInterp, None,),
+			(ReasoningModel, None,),
+			(simulation.Simulation, ["_assess_weights", "_calc_scores", "_calc_scores_batch", "_synthesize"],),
+		]
+
+	@staticmethod
+	def __wrap_call(name, fn):
+		stat = Instrumentation._calls.setdefault(name, [0, 0., 0.])
+
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			begin = time.perf_counter()
+
+			try:
+				return fn(*args, **kwargs)
+			finally:
+				elapsed = time.perf_counter() - begin
+				stat[0] += 1
+				stat[1] += elapsed
+				stat[2] = max(stat[2], elapsed)
+
+		return wrapper
+
+	@staticmethod
+	def __wrap_init(cls):
+		init = cls.__init__
+		Instrumentation._created.setdefault(cls.__name__, 0)
+
+		@functools.wraps(init)
+		def wrapper(self, *args, **kwargs):
+			Instrumentation._created[cls.__name__] += 1
+			init(self, *args, **kwargs)
+
+		return wrapper
+
+	@staticmethod
+	def __wrap_run(run):
+		@functools.wraps(run)
+		def wrapper(*args, **kwargs):
+			before = Instrumentation.snapshot()
+
+			try:
+				return run(*args, **kwargs)
+			finally:
+				Instrumentation._runs.append(Instrumentation.__diff(Instrumentation.snapshot(), before))
+
+		return wrapper
+
+	@staticmethod
+	def __patch(cls, attribute, wrapped):
+		Instrumentation._originals.append((cls, attribute, cls.__dict__[attribute],))
+		setattr(cls, attribute, wrapped)
+
+	@staticmethod
+	def enable():
+		if Instrumentation.is_enabled():
+			return
+
+		for cls, names in Instrumentation.__get_targets():
+			if names is None:
+				names = [k for k, v in cls.__dict__.items() if not k.startswith("__") and not isinstance(v, type) and
+					(isinstance(v, (staticmethod, classmethod,)) or callable(v))]
+
+			for name in names:
+				attribute = cls.__dict__[name]
+				qualname = cls.__name__ + "." + name.replace("_" + cls.__name__, "")
+
+				if isinstance(attribute, (staticmethod, classmethod,)):
+					wrapped = type(attribute)(Instrumentation.__wrap_call(qualname, attribute.__func__))
+				else:
+					wrapped = Instrumentation.__wrap_call(qualname, attribute)
+
+				Instrumentation.__patch(cls, name, wrapped)
+
+		for cls in [Situation, Outcome]:
+			Instrumentation.__patch(cls, "__init__", Instrumentation.__wrap_init(cls))
+
+		simulation = importlib.import_module("simulation").Simulation
+		Instrumentation.__patch(simulation, "run", Instrumentation.__wrap_run(simulation.__dict__["run"]))
+
+	@staticmethod
+	def disable():
+		""" Restores the original methods. Counters are kept """
+		for cls, attribute, original in reversed(Instrumentation._originals):
+			setattr(cls, attribute, original)
+
+		Instrumentation._originals.clear()
+
+	@staticmethod
+	def is_enabled():
+		return len(Instrumentation._originals) > 0
+
+	@staticmethod
+	def reset():
+		for stat in Instrumentation._calls.values():
+			stat[:] = [0, 0., 0.]
+
+		for name in Instrumentation._created.keys():
+			Instrumentation._created[name] = 0
+
+		Instrumentation._runs.clear()
+
+	@staticmethod
+	def snapshot():
+		"""
+		:return: {"calls": {"Class.method": {"count", "total", "per_call", "max"}}, "created": {class name: count}}.
+		Times are in seconds. Methods that have not been called are omitted
+		"""
+		calls = dict((name, dict(count=count, total=total, per_call=total / count, max=max_time),)
+			for name, (count, total, max_time) in Instrumentation._calls.items() if count)
+
+		return dict(calls=calls, created=dict(Instrumentation._created))
+
+	@staticmethod
+	def __diff(snapshot, before):
+		calls = dict()
+
+		for name, stat in snapshot["calls"].items():
+			stat_before = before["calls"].get(name, dict(count=0, total=0.))
+			count = stat["count"] - stat_before["count"]
+
+			if count:
+				total = stat["total"] - stat_before["total"]
+				calls[name] = dict(count=count, total=total, per_call=total / count)
+
+		created = dict((k, v - before["created"].get(k, 0),) for k, v in snapshot["created"].items())
+
+		return dict(calls=calls, created=created)
+
+	@staticmethod
+	def get_runs():
+		""" Per-run snapshots (without "max"), one for each `Simulation.run` completed while being enabled """
+		return list(Instrumentation._runs)
+
+	@staticmethod
+	def to_json(filename=None, **kwargs):
+		"""
+		:param filename: if not None, the counters are also saved there
+		:return: JSON string of the snapshot, plus per-run snapshots under "runs"
+		"""
+		res = json.dumps(dict(Instrumentation.snapshot(), runs=Instrumentation._runs), **kwargs)
+
+		if filename is not None:
+			with open(filename, 'w') as f:
+				f.write(res)
+
+		return res
@@ -4,8 +4,10 @@ from _ast import Sub
 from ahpy.ahpy.ahpy import Graph, to_pairwise
 from enum import Enum
 import copy
+import itertools
 import math
-from scipy.spatial.distance import cityblock
+import numpy as np
+from scipy.spatial import cKDTree
 from functools import reduce
 from dataclasses import dataclass
 from generic import Log
@@ -48,16 +50,102 @@ class Rules:
 
 
 @dataclass
+class Approximation:
+	"""
+	Instead of every reachable rival, an agent gets assessed against `n_samples` rivals drawn (with replacement) by
+	their probabilities of interaction. The interaction part of a score is then an unbiased estimate of the exact one,
+	and its standard error is reported along with it. Only the rivals within the reach distance get looked up and
+	sampled from, so the cost per agent grows with the number of those, not with the number of rivals overall
+	"""
+	n_samples: int = 32  # At least 2, for the error to be estimated
+	seed: int = None
+
+
 class Score:
-	energy: float = None
-	resource: float = None
+	""" View onto an (energy, resource) pair of an `Outcome` """
+
+	__slots__ = ("values", "offset",)
+
+	def __init__(self, values, offset):
+		self.values = values
+		self.offset = offset
+
+	@property
+	def energy(self):
+		return self.values[self.offset]
+
+	@energy.setter
+	def energy(self, value):
+		self.values[self.offset] = value
+
+	@property
+	def resource(self):
+		return self.values[self.offset + 1]
+
+	@resource.setter
+	def resource(self, value):
+		self.values[self.offset + 1] = value
+
+	def __repr__(self):
+		return "Score(energy=" + str(self.energy) + ", resource=" + str(self.resource) + ")"
 
 
-@dataclass
 class Outcome:
-	gain: Score = Score()
-	loss: Score = Score()
-	enemy_loss: Score = Score()
+	"""
+	Fixed layout of 6 values: gain, loss, and enemy loss, of energy and resource each. Per-tick outcomes have an extra
+	trailing axis, so do stacks of outcomes have a leading one.
+	"""
+
+	__slots__ = ("values",)
+
+	GAIN_ENERGY, GAIN_RESOURCE, LOSS_ENERGY, LOSS_RESOURCE, ENEMY_LOSS_ENERGY, ENEMY_LOSS_RESOURCE = range(6)
+
+	def __init__(self, shape=(), values=None):
+		"""
+		:param shape: shape of each value, e.g. (n_ticks,)
+		"""
+		self.values = np.zeros((6,) + tuple(shape)) if values is None else values
+
+	@property
+	def gain(self):
+		return Score(self.values, Outcome.GAIN_ENERGY)
+
+	@property
+	def loss(self):
+		return Score(self.values, Outcome.LOSS_ENERGY)
+
+	@property
+	def enemy_loss(self):
+		return Score(self.values, Outcome.ENEMY_LOSS_ENERGY)
+
+	def accumulate(self, other, weight=1):
+		""" In-place weighted sum """
+		self.values += other.values * weight
+
+		return self
+
+	@staticmethod
+	def stack(outcomes):
+		""" Values of outcomes shaped (len(outcomes), 6, ...) """
+		return np.stack([o.values for o in outcomes])
+
+	@staticmethod
+	def to_scores(values):
+		""" Projects outcome values shaped (6, ...) onto aspects. Returns scores shaped (aspects, ...), in `SubStrategy` order """
+
+		def inv(v):
+			return np.divide(1, v, out=np.zeros(v.shape), where=v != 0)
+
+		scores = {
+			SubStrategy.ENEMY_WEAKENING: values[Outcome.ENEMY_LOSS_ENERGY],
+			SubStrategy.ENEMY_RESOURCE_DEPRIVATION: values[Outcome.ENEMY_LOSS_RESOURCE],
+			SubStrategy.RESOURCE_SAVING: inv(values[Outcome.LOSS_RESOURCE]),
+			SubStrategy.STRENGTH_SAVING: inv(values[Outcome.LOSS_ENERGY]),
+			SubStrategy.STRENGTH_GAINING: values[Outcome.GAIN_ENERGY],
+			SubStrategy.RESOURCE_ACQUISITION: values[Outcome.GAIN_RESOURCE],
+		}
+
+		return np.stack([scores[aspect] for aspect in SubStrategy])
 
 
 class SubStrategy(Enum):
@@ -101,6 +189,70 @@ class Situation:
 	ticks: int = None
 
 
+class FightEnergyTable:
+	"""
+	Energies before fight (see `RulesInterp.get_energy_before_fight`) and distances covered (see
+	`RulesInterp.is_reachable`) by agents, per activity and tick. Those only depend on an agent's energy and type, so
+	each row is computed once, on the first request, and is then reused throughout an evaluation. A table is not aware
+	of changes to the rules.
+	"""
+
+	__slots__ = ("rules", "rows", "reach_rows",)
+
+	def __init__(self, rules):
+		self.rules = rules
+		self.rows = dict()  # (energy, activity) -> energies before fight shaped (ticks_max + 1,)
+		self.reach_rows = dict()  # (energy, type, activity) -> distances covered shaped (ticks_max + 1,)
+
+	def __get_index(self, ticks):
+		""" `ticks` as indices into rows, or None, unless those are whole ticks in [0; ticks_max] """
+		ticks = np.asarray(ticks)
+
+		if ticks.dtype.kind not in "iuf" or not np.all((ticks >= 0) & (ticks <= self.rules.ticks_max)):
+			return None
+		elif ticks.dtype.kind == "f":
+			return ticks.astype(int) if np.all(ticks == np.trunc(ticks)) else None
+
+		return ticks
+
+	def get(self, agent, activity: Activity, ticks):
+		""" `ticks` may be an array. Those off the table's range get computed on each request """
+		index = self.__get_index(ticks)
+
+		if index is None:
+			return RulesInterp.get_energy_before_fight(self.rules, Situation(agent=agent, activity=activity, ticks=ticks))
+
+		key = (agent.energy, activity,)
+		row = self.rows.get(key)
+
+		if row is None:
+			row = RulesInterp.get_energy_before_fight(self.rules, Situation(agent=agent, activity=activity,
+				ticks=np.arange(self.rules.ticks_max + 1)))
+			self.rows[key] = row
+
+		return row[index]
+
+	def get_reach(self, agent, activity: Activity, ticks):
+		""" `ticks` may be an array. Those off the table's range get computed on each request """
+		index = self.__get_index(ticks)
+		is_moving = agent.type == Agent.Type.HITTER and activity != Activity.IDLE
+
+		if index is None:
+			n_ticks = RulesInterp.get_ticks_available(self.rules, Situation(agent=agent, activity=activity))
+
+			return is_moving * self.rules.movement.speed * (n_ticks if ticks is None else np.minimum(ticks, n_ticks))
+
+		key = (agent.energy, agent.type, activity,)
+		row = self.reach_rows.get(key)
+
+		if row is None:
+			n_ticks = RulesInterp.get_ticks_available(self.rules, Situation(agent=agent, activity=activity))
+			row = is_moving * self.rules.movement.speed * np.minimum(np.arange(self.rules.ticks_max + 1), n_ticks)
+			self.reach_rows[key] = row
+
+		return row[index]
+
+
 class RulesInterp:
 	"""
 	Binding link btw. agents, actions, and rules. Covers those aspects of situation assessment that do not involve
@@ -206,12 +358,17 @@ class RulesInterp:
 
 	@staticmethod
 	def get_distance(rules: Rules, situation: Situation):
-		""" distance b\w agents """
-		return cityblock(situation.agent.coord, situation.agent_other.coord)
+		""" Manhattan distance b/w agents """
+		return sum(abs(c - c_other) for c, c_other in zip(situation.agent.coord, situation.agent_other.coord))
 
 	@staticmethod
-	def is_reachable(rules: Rules, situation: Situation):
-		""" Estimates whether or not a particular agent can be reached / can reach another agent within a particular timespan. """
+	def is_reachable(rules: Rules, situation: Situation, distance=None):
+		"""
+		Estimates whether or not a particular agent can be reached / can reach another agent within a particular timespan.
+		`situation.ticks` may be an array, the result is evaluated per tick then.
+
+		:param distance: distance b/w the agents, if known beforehand
+		"""
 
 		def is_moving(agent_type: Agent.Type, activity: Activity):
 			""" We either know for a fact that this agent is not moving, or we just assume that it does """
@@ -224,11 +381,11 @@ class RulesInterp:
 
 		speed1 = is_moving(situation.agent.type, situation.activity) * rules.movement.speed
 		nticks1 = RulesInterp.get_ticks_available(rules, Situation(agent=situation.agent, activity=situation.activity))
-		time1 = nticks1 if situation.ticks is None else min([situation.ticks, nticks1])
+		time1 = nticks1 if situation.ticks is None else np.minimum(situation.ticks, nticks1)
 		speed2 = is_moving(situation.agent_other.type, situation.activity_other) * rules.movement.speed
 		nticks2 = RulesInterp.get_ticks_available(rules, Situation(agent=situation.agent_other, activity=situation.activity_other))
-		time2 = nticks2 if situation.ticks is None else min([nticks2, situation.ticks])
-		distance = RulesInterp.get_distance(rules, situation)
+		time2 = nticks2 if situation.ticks is None else np.minimum(nticks2, situation.ticks)
+		distance = RulesInterp.get_distance(rules, situation) if distance is None else distance
 
 		return speed1 * time1 + speed2 * time2 >= distance
 
@@ -242,117 +399,166 @@ class RulesInterp:
 		else:
 			return rules.ticks_max
 
+	@staticmethod
+	def get_reach_distance(rules: Rules):
+		""" Upper bound on the distance two agents may close within an iteration, when both are moving """
+		return 2 * rules.movement.speed * rules.ticks_max
+
 
 class ReasoningModel:
 
-	def __init__(self, rules: Rules):
+	def __init__(self, rules: Rules, distance=None, approximation: Approximation = None):
 		"""
 		:param world_team: The world representing the state of a current team, and specifically the world's state of an
 		agent for which the control action inferring (weighting) is about to take place
+		:param distance: callable (agent, agent_other) -> distance, e.g. a cache owned by the world. If None, distances
+		are computed on each request
+		:param approximation: if not None, `calc_expected_gain_batch` samples rivals, see `Approximation`
 		"""
 		self.rules = rules
+		self.distance = distance
+		self.approximation = approximation
+		# Samples are drawn from a stream seeded by the agents assessed, so that they do not depend on the order the
+		# agents get assessed in, or on the process that does it
+		self.entropy = None if approximation is None else np.random.SeedSequence(approximation.seed).entropy
 
 		Log.debug(ReasoningModel.__init__, "rules:", self.rules)
 
-	def calc_int_hit(self, agent, ticks, activity: Activity, agent_other):
+	def get_distance(self, agent, agent_other):
+		if self.distance is None:
+			return RulesInterp.get_distance(self.rules, Situation(agent=agent, agent_other=agent_other))
+
+		return self.distance(agent, agent_other)
+
+	def calc_int_hit(self, agent, ticks, activity: Activity, agent_other, energy_table=None):
+		"""
+		`ticks` may be an array, the outcome's fields are evaluated per tick then
+
+		:param energy_table: `FightEnergyTable` shared by the calls made within one evaluation. If None, the energies
+		are only reused within this call
+		"""
 
 		assert activity is not None
 
-		outcome = Outcome(Score(0, 0), Score(0, 0), Score(0, 0))
+		outcome = Outcome(np.shape(ticks))
 		n_activities = len(list(Activity))
+		distance = self.get_distance(agent, agent_other)
+		energy_table = FightEnergyTable(self.rules) if energy_table is None else energy_table
+		energy = energy_table.get(agent, activity, ticks)
+		reach = energy_table.get_reach(agent, activity, ticks)
+		attack = self.rules.attack
 
 		for activity_other in Activity:
 			situation_direct = Situation(agent=agent, agent_other=agent_other, activity=activity, activity_other=activity_other, ticks=ticks)
 
-			if not RulesInterp.is_fightable(self.rules, situation_direct) or not RulesInterp.is_reachable(self.rules, situation_direct):
+			if not RulesInterp.is_fightable(self.rules, situation_direct):
 				continue  # There is no fight, nobody gains, nobody loses
 
-			situation_reverse = Situation(agent=agent_other, agent_other=agent, activity=activity_other, activity_other=activity, ticks=ticks)
-			energy = RulesInterp.get_energy_before_fight(self.rules, situation_direct)
-			energy_other = RulesInterp.get_energy_before_fight(self.rules, situation_reverse)
+			reachable = reach + energy_table.get_reach(agent_other, activity_other, ticks) >= distance  # See `RulesInterp.is_reachable`
+
+			if not np.any(reachable):
+				continue
+
+			weight = reachable / n_activities  # Unreachable ticks do not contribute
+			energy_other = energy_table.get(agent_other, activity_other, ticks)
 			win_probability = energy / (energy + energy_other)
 
-			# Those values get adjusted for all possible states another agent is in. Other agent's states are considered equally probable
-			outcome.gain.energy += RulesInterp.get_fight_energy_gain(self.rules, situation_direct) * win_probability / n_activities
-			outcome.gain.resource += RulesInterp.get_fight_resource_gain(self.rules, situation_direct) * win_probability / n_activities
-			outcome.loss.energy += RulesInterp.get_fight_energy_loss(self.rules, situation_direct) * (1 - win_probability) / n_activities
-			outcome.loss.resource += RulesInterp.get_fight_resource_loss(self.rules, situation_direct) * (1 - win_probability) / n_activities
-			outcome.enemy_loss.energy += RulesInterp.get_fight_energy_loss(self.rules, situation_reverse) * win_probability / n_activities
-			outcome.enemy_loss.resource += RulesInterp.get_fight_resource_loss(self.rules, situation_reverse) * win_probability / n_activities
+			# Those values get adjusted for all possible states another agent is in. Other agent's states are considered
+			# equally probable. See `RulesInterp.get_fight_*` for what the terms are
+			values = outcome.values
+			values[Outcome.GAIN_ENERGY] += energy_other * attack.gain_energy_win * win_probability * weight
+			values[Outcome.GAIN_RESOURCE] += energy_other * attack.gain_resource_win * win_probability * weight
+			values[Outcome.LOSS_ENERGY] += energy * (1 - win_probability) * weight
+			values[Outcome.LOSS_RESOURCE] += energy * attack.loss_resource_lose * (1 - win_probability) * weight
+			values[Outcome.ENEMY_LOSS_ENERGY] += energy_other * win_probability * weight
+			values[Outcome.ENEMY_LOSS_RESOURCE] += energy_other * attack.loss_resource_lose * win_probability * weight
 
 		return outcome
 
 	def calc_int_take(self, agent: Agent, ticks, activity, resource: Agent):
+		""" `ticks` may be an array, the outcome's fields are evaluated per tick then """
 		situation = Situation(agent=agent, ticks=ticks, activity=activity, agent_other=resource)
 
-		outcome = Outcome()
+		outcome = Outcome(np.shape(ticks))
+
+		if not RulesInterp.is_gatherable(self.rules, situation):
+			return outcome
+
+		reachable = RulesInterp.is_reachable(self.rules, situation, self.get_distance(agent, resource))
 
-		if not RulesInterp.is_gatherable(self.rules, situation) or not RulesInterp.is_reachable(self.rules, situation):
+		if not np.any(reachable):
 			return outcome
 
-		outcome.gain.resource = RulesInterp.get_gather_resource_gain(self.rules, situation)
-		outcome.gain.energy = RulesInterp.get_gather_energy_gain(self.rules, situation)
+		outcome.values[Outcome.GAIN_RESOURCE] = RulesInterp.get_gather_resource_gain(self.rules, situation) * reachable
+		outcome.values[Outcome.GAIN_ENERGY] = RulesInterp.get_gather_energy_gain(self.rules, situation) * reachable
 
 		return outcome
 
 	def calc_mv(self, agent: Agent, ticks, activity: Activity):
+		""" `ticks` may be an array, the outcome's fields are evaluated per tick then """
 		situation = Situation(agent=agent, activity=activity, ticks=ticks)
-		outcome = Outcome()
+		outcome = Outcome(np.shape(ticks))
 		mv_delta = RulesInterp.get_energy_delta_movement(self.rules, situation)
 
-		if mv_delta > 0:
-			outcome.gain.energy = mv_delta
-		else:
-			outcome.loss.energy = -mv_delta
+		outcome.values[Outcome.GAIN_ENERGY] = np.maximum(mv_delta, 0)
+		outcome.values[Outcome.LOSS_ENERGY] = np.maximum(-mv_delta, 0)
 
 		return outcome
 
 	def __calc_expected_gain(self, agent, agents_reachable, n_ticks, cb_gain_mv_t=lambda agent, t: None,
 		cb_gain_int_a_t=lambda agent, agent_other, t: None):
+		"""
+		The callbacks get the whole tick horizon as an array at once, and return per-tick gains shaped (aspects, ticks)
+		"""
 
-		def prob_int(a: Agent):
-			return RulesInterp.get_distance(self.rules, Situation(agent, a)) / dist_sum
+		if n_ticks <= 0:
+			return np.zeros(len(list(SubStrategy)))
 
-		def expected_gain_int_t(t):
-			return reduce(lambda g_sum, agent_other: g_sum + cb_gain_int_a_t(agent, agent_other, t) * prob_int(agent_other), agents_reachable, 0)
+		ticks_mv = np.arange(1, n_ticks + 1)  # t \in [1; N_t]
+		ticks_int = ticks_mv[:-1]  # t \in [1; N_1 - 1]
+		gain_mv = np.sum(cb_gain_mv_t(agent, ticks_mv), axis=-1)
+		gain_int = 0
 
-		dist_sum = reduce(lambda s, a: s + RulesInterp.get_distance(self.rules, Situation(agent, a)), agents_reachable, 0)
-		gain_mv = reduce(lambda g_sum, t: g_sum + cb_gain_mv_t(agent, t), range(1, n_ticks + 1), 0)  # t \in [1; N_t]
-		gain_int = reduce(lambda g_sum, t: g_sum + expected_gain_int_t(t), range(1, n_ticks), 0)  # t \in [1; N_1 - 1]
+		if len(ticks_int):
+			distances = [self.get_distance(agent, a) for a in agents_reachable]
+			dist_sum = sum(distances)
+			gain_int = reduce(lambda g_sum, a_d: g_sum + np.sum(cb_gain_int_a_t(agent, a_d[0], ticks_int), axis=-1) * a_d[1] / dist_sum,
+				zip(agents_reachable, distances), 0)
 
 		return (gain_mv + gain_int) / n_ticks
 
-	@staticmethod
-	def __outcome_to_score(outcome: Outcome, aspect: SubStrategy):
-		return {
-			SubStrategy.ENEMY_WEAKENING: outcome.enemy_loss.energy if outcome.enemy_loss.energy else 0,
-			SubStrategy.ENEMY_RESOURCE_DEPRIVATION: outcome.enemy_loss.resource if outcome.enemy_loss.resource else 0,
-			SubStrategy.RESOURCE_SAVING: 1 / outcome.loss.resource if outcome.loss.resource else 0,
-			SubStrategy.STRENGTH_SAVING: 1 / outcome.loss.energy if outcome.loss.energy else 0,
-			SubStrategy.STRENGTH_GAINING: outcome.gain.energy if outcome.gain.energy else 0,
-			SubStrategy.RESOURCE_ACQUISITION: outcome.gain.resource if outcome.gain.resource else 0,
-		}[aspect]
-
 	def calc_expected_gain(self, agent, agents, aspect: SubStrategy, activity: Activity):
+		return self.calc_expected_gains(agent, agents, activity)[aspect]
+
+	def calc_expected_gains(self, agent, agents, activity: Activity, energy_table=None):
+		"""
+		Same as `calc_expected_gain`, but the interaction outcomes get evaluated only once, and then get projected onto
+		every aspect.
+
+		:param energy_table: `FightEnergyTable` to share across calls, e.g. for every activity of an agent
+		:return: {SubStrategy: score}
+		"""
+		energy_table = FightEnergyTable(self.rules) if energy_table is None else energy_table
 
 		def gain_int_a_t(a, ao, t):
 			s = Situation(agent=a, agent_other=ao, ticks=t, activity=activity)
 
 			if RulesInterp.is_fightable(self.rules, s):
-				outcome = self.calc_int_hit(a, t, activity, ao)
+				outcome = self.calc_int_hit(a, t, activity, ao, energy_table)
 			elif RulesInterp.is_gatherable(self.rules, s):
 				outcome = self.calc_int_take(a, t, activity, ao)
 
-			return self.__outcome_to_score(outcome, aspect)
+			return Outcome.to_scores(outcome.values)
 
 		def gain_mv_t(a, t):
-			outcome = self.calc_mv(a, t, activity)
-
-			return self.__outcome_to_score(outcome, aspect)
+			return Outcome.to_scores(self.calc_mv(a, t, activity).values)
 
 		def situation(a):
 			return Situation(agent=agent, agent_other=a, activity=activity, ticks=n_ticks)
 
+		def is_reachable(a):
+			return RulesInterp.is_reachable(self.rules, situation(a), self.get_distance(agent, a))
+
 		n_ticks = RulesInterp.get_ticks_available(self.rules, Situation(agent=agent, activity=activity))
 
 		if activity == Activity.TAKE:
@@ -360,12 +566,348 @@ class ReasoningModel:
 			# The following helps us filter out the agent's teammates.
 			agents_reachable = list(filter(lambda a: (RulesInterp.is_gatherable(self.rules, situation(a)) or
 				RulesInterp.is_fightable(self.rules, situation(a))) and
-				RulesInterp.is_reachable(self.rules, situation(a)), agents))
+				is_reachable(a), agents))
 		else:
 			# For any other action, interactions are limited to adversarial teams only
 			agents_reachable = list(filter(lambda a: RulesInterp.is_fightable(self.rules, situation(a)) and
-				RulesInterp.is_reachable(self.rules, situation(a)), agents))
+				is_reachable(a), agents))
+
+		if __debug__:
+			Log.debug(self.calc_expected_gains, "agent id.:", agent.id, "N others:", len(agents_reachable), "activity:", activity.value)
+
+		gains = self.__calc_expected_gain(agent, agents_reachable, n_ticks, gain_mv_t, gain_int_a_t)
+
+		return dict(zip(SubStrategy, map(float, gains)))
+
+	BATCH_CHUNK_SIZE = 1 << 20  # Upper bound on the number of (agent, other agent, tick) triples processed at once
+
+	def __calc_ticks_available_batch(self, energy, activity: Activity):
+		""" Array counterpart of `RulesInterp.get_ticks_available` """
+		if activity == Activity.IDLE:
+			return np.full(energy.shape, float(self.rules.ticks_max))
+
+		return np.minimum(self.rules.ticks_max, np.trunc(energy / self.rules.movement.loss_energy_moving))
+
+	def __calc_energy_before_fight_batch(self, energy, activity: Activity, ticks):
+		""" Energies shaped energy.shape + ticks.shape """
+		situation = Situation(agent=Agent(energy=energy[..., None]), activity=activity, ticks=ticks)
+
+		return RulesInterp.get_energy_before_fight(self.rules, situation)
+
+	def __calc_int_hit_batch(self, energy, n_ticks, activity: Activity, energy_other, distance, ticks):
+		"""
+		`calc_int_hit` for every (agent, other agent, tick) triple. Returns an outcome shaped (agents, others, ticks)
+
+		:param energy_other: energies of the others shaped (others,), or (agents, others), if those differ per agent
+		"""
+		n_activities = len(list(Activity))
+		energy_other = np.atleast_2d(energy_other)
+		speed = self.rules.movement.speed
+		outcome = Outcome(distance.shape + ticks.shape)
+		values = outcome.values
+
+		energy_adjusted = self.__calc_energy_before_fight_batch(energy, activity, ticks)[:, None, :]
+		time = np.minimum(ticks[None, :], n_ticks[:, None])[:, None, :]
+		dist_this = (activity != Activity.IDLE) * speed * time
+
+		for activity_other in Activity:
+			if Activity.HIT not in [activity, activity_other]:
+				continue  # There is no fight, nobody gains, nobody loses
+
+			energy_adjusted_other = self.__calc_energy_before_fight_batch(energy_other, activity_other, ticks)
+			time_other = np.minimum(ticks, self.__calc_ticks_available_batch(energy_other, activity_other)[..., None])
+			dist_other = (activity_other != Activity.IDLE) * speed * time_other
+			reachable = dist_this + dist_other >= distance[:, :, None]
+			win_probability = energy_adjusted / (energy_adjusted + energy_adjusted_other) * reachable
+
+			values[Outcome.GAIN_ENERGY] += energy_adjusted_other * self.rules.attack.gain_energy_win * win_probability / n_activities
+			values[Outcome.GAIN_RESOURCE] += energy_adjusted_other * self.rules.attack.gain_resource_win * win_probability / n_activities
+			values[Outcome.LOSS_ENERGY] += energy_adjusted * (reachable - win_probability) / n_activities
+			values[Outcome.LOSS_RESOURCE] += energy_adjusted * self.rules.attack.loss_resource_lose * (reachable - win_probability) / n_activities
+			values[Outcome.ENEMY_LOSS_ENERGY] += energy_adjusted_other * win_probability / n_activities
+			values[Outcome.ENEMY_LOSS_RESOURCE] += energy_adjusted_other * self.rules.attack.loss_resource_lose * win_probability / n_activities
+
+		return outcome
+
+	def __calc_int_take_batch(self, n_ticks, energy_other, distance, ticks):
+		"""
+		`calc_int_take` for every (agent, resource, tick) triple. Returns an outcome shaped (agents, others, ticks)
+
+		:param energy_other: energies of the others shaped (others,), or (agents, others), if those differ per agent
+		"""
+		time = np.minimum(ticks[None, :], n_ticks[:, None])[:, None, :]
+		reachable = self.rules.movement.speed * time >= distance[:, :, None]
+		energy_other = np.atleast_2d(energy_other)[..., None]
+		outcome = Outcome(reachable.shape)
+		outcome.values[Outcome.GAIN_ENERGY] = energy_other * self.rules.resource.gain_energy * reachable
+		outcome.values[Outcome.GAIN_RESOURCE] = energy_other * self.rules.resource.gain_resource * reachable
+
+		return outcome
+
+	def __calc_expected_gain_batch(self, agents, others, activity: Activity, rng=None):
+		"""
+		:param agents: columns (see `calc_expected_gain_batch`) of the agents being assessed
+		:param others: columns of rivals and resources shaped (others, ...), or (agents, others, ...), if those differ
+		per agent
+		:param rng: generator to sample rivals with, if the model approximates
+		:return: scores shaped (agents, aspects), and their standard errors, see `Approximation`
+		"""
+		coord, energy, team, is_hitter, _ = agents
+		coord_other, energy_other, team_other, is_hitter_other, is_resource_other = others if others[1].ndim == 2 else \
+			[c[None] for c in others]
+		speed = self.rules.movement.speed
+
+		n_ticks = self.__calc_ticks_available_batch(energy, activity)
+		distance = np.abs(coord[:, None, :] - coord_other).sum(axis=2)
+
+		# Same filtering as in `calc_expected_gain`: hit adversarial hitters, or take resources when gathering
+		fightable = is_hitter[:, None] & is_hitter_other & (team[:, None] != team_other)
+		gatherable = is_hitter[:, None] & is_resource_other & (activity == Activity.TAKE)
+		ticks_other = np.minimum(n_ticks[:, None], self.__calc_ticks_available_batch(energy_other, None))
+		reachable = (activity != Activity.IDLE) * speed * n_ticks[:, None] + is_hitter_other * speed * ticks_other >= distance
+		distance_reachable = distance * ((fightable | gatherable) & reachable)
+		dist_sum = distance_reachable.sum(axis=1, keepdims=True)
+		prob_int = np.divide(distance_reachable, dist_sum, out=np.zeros(distance.shape), where=dist_sum != 0)
+
+		n_ticks_max = int(max(n_ticks.max(initial=0), 0))
+		ticks = np.arange(1, n_ticks_max + 1, dtype=float)
+		ticks_int = ticks[:-1]  # t \in [1; N_t - 1]
+
+		scores_mv = Outcome.to_scores(self.calc_mv(None, ticks, activity).values)
+		gain_mv = np.einsum("st,nt->ns", scores_mv, ticks[None, :] <= n_ticks[:, None])
+
+		error_int = np.zeros(gain_mv.shape)
+		is_sampled = self.approximation is not None and self.approximation.n_samples < energy_other.shape[1]
+
+		if is_sampled:
+			# Others drawn by `prob_int` stand for every one of them, each with an equal weight
+			sample = ReasoningModel.__sample_batch(prob_int, self.approximation.n_samples, rng)
+			rows = np.arange(len(energy))[:, None]
+			prob_int = (dist_sum != 0) * np.full(sample.shape, 1 / sample.shape[1])
+			distance, fightable, gatherable = distance[rows, sample], fightable[rows, sample], gatherable[rows, sample]
+			energy_other = np.broadcast_to(energy_other, (len(energy), energy_other.shape[1]))[rows, sample]
+
+		# Fights and gathering never overlap, so the outcomes may be summed up before getting projected onto aspects
+		outcome_int = self.__calc_int_hit_batch(energy, n_ticks, activity, energy_other, distance, ticks_int)
+		outcome_int.values *= fightable[:, :, None]
+
+		if activity == Activity.TAKE:
+			outcome_int.accumulate(self.__calc_int_take_batch(n_ticks, energy_other, distance, ticks_int), gatherable[:, :, None])
+
+		scores_int = Outcome.to_scores(outcome_int.values)
+		is_tick_int = ticks_int[None, :] <= n_ticks[:, None] - 1
+		gain_int = np.einsum("snmt,nm,nt->ns", scores_int, prob_int, is_tick_int)
+
+		if is_sampled:
+			gain_int_sample = np.einsum("snmt,nt->nsm", scores_int, is_tick_int)
+			error_int = (dist_sum != 0) * gain_int_sample.std(axis=2, ddof=1) / np.sqrt(gain_int_sample.shape[2])
 
-		Log.debug(self.calc_expected_gain, "agent id.:", agent.id, "N others:", len(agents_reachable), "aspect:", aspect.value, "activity:", activity.value)
+		return tuple(np.divide(v, n_ticks[:, None], out=np.zeros(gain_mv.shape), where=n_ticks[:, None] > 0) for v in
+			[gain_mv + gain_int, error_int])
 
-		return self.__calc_expected_gain(agent, agents_reachable, n_ticks, gain_mv_t, gain_int_a_t)
+	@staticmethod
+	def __sample_batch(prob, n_samples, rng):
+		""" Indices of columns drawn by each row's probabilities, shaped (rows, n_samples) """
+		n_rows, n_columns = prob.shape
+		offset = np.arange(n_rows)[:, None]
+		cdf = (np.cumsum(prob, axis=1) + offset).ravel()
+		sample = np.searchsorted(cdf, rng.random((n_rows, n_samples)) + offset, side="right") - offset * n_columns
+
+		return np.clip(sample, 0, n_columns - 1)
+
+	@staticmethod
+	def __gather_others(columns, candidates):
+		"""
+		Columns of each agent's candidates shaped (agents, max N candidates, ...). The rows are padded with others
+		which are neither hitters, nor resources, so nobody interacts with them
+
+		:param candidates: indices of the others, a sequence per agent
+		"""
+		lengths = np.array([len(c) for c in candidates], dtype=int)
+		index = np.zeros((len(candidates), lengths.max(initial=0)), dtype=np.intp)
+		is_candidate = np.arange(index.shape[1])[None, :] < lengths[:, None]
+		index[is_candidate] = np.fromiter(itertools.chain.from_iterable(candidates), dtype=np.intp, count=lengths.sum())
+		coord, energy, team, is_hitter, is_resource = [c[index] for c in columns]
+
+		return coord, energy, team, is_hitter & is_candidate, is_resource & is_candidate
+
+	@staticmethod
+	def __to_columns(agents, teams):
+		coord = np.array([a.coord for a in agents], dtype=float).reshape(len(agents), -1 if len(agents) else 0)
+		energy = np.array([a.energy for a in agents], dtype=float)
+		team = np.array([teams.setdefault(a.team, len(teams)) for a in agents], dtype=int)
+		is_hitter = np.array([a.type == Agent.Type.HITTER for a in agents], dtype=bool)
+		is_resource = np.array([a.type == Agent.Type.RESOURCE for a in agents], dtype=bool)
+
+		return coord, energy, team, is_hitter, is_resource
+
+	def calc_expected_gain_batch(self, agents, agents_other, errors=None):
+		"""
+		Vectorized counterpart of `calc_expected_gain`, assesses every agent against every other agent for every aspect
+		and activity at once.
+
+		:param errors: array shaped as the result, if not None, gets the standard errors of the scores, which are only
+		non-zero, if the model approximates, see `Approximation`
+		:return: scores shaped (len(agents), len(SubStrategy), len(Activity)), ordered as the enums are
+		"""
+		teams = dict()
+		columns = ReasoningModel.__to_columns(agents, teams)
+		columns_other = ReasoningModel.__to_columns(agents_other, teams)
+
+		if not len(agents_other):
+			columns_other = (np.zeros((0, columns[0].shape[1])),) + columns_other[1:]
+
+		res = np.zeros((len(agents), len(list(SubStrategy)), len(list(Activity))))
+		rng = None if self.entropy is None else np.random.default_rng([self.entropy] + [int(a.id) for a in agents])
+		candidates = None
+
+		if self.approximation is not None and len(agents) and len(agents_other):
+			# Others farther than the reach distance never interact, so only those within it get gathered per agent, and
+			# sampled from. The bound is loosened for the rounding of the tree
+			radius = RulesInterp.get_reach_distance(self.rules) * (1 + 1e-9) + 1e-12
+			candidates = cKDTree(columns_other[0]).query_ball_point(columns[0], radius, p=1)
+
+		n_others = len(agents_other) if candidates is None else max(map(len, candidates))
+		n_chunk = max(1, ReasoningModel.BATCH_CHUNK_SIZE // max(1, n_others * self.rules.ticks_max))
+
+		for begin in range(0, len(agents), n_chunk):
+			chunk = tuple(c[begin:begin + n_chunk] for c in columns)
+			others = columns_other if candidates is None else \
+				ReasoningModel.__gather_others(columns_other, candidates[begin:begin + n_chunk])
+
+			for i, activity in enumerate(Activity):
+				scores, scores_errors = self.__calc_expected_gain_batch(chunk, others, activity, rng)
+				res[begin:begin + n_chunk, :, i] = scores
+
+				if errors is not None:
+					errors[begin:begin + n_chunk, :, i] = scores_errors
+
+		Log.debug(self.calc_expected_gain_batch, "N agents:", len(agents), "N others:", len(agents_other))
+
+		return res
+
+	def __accumulate_int_hit(self, values, energy, energy_other, reachable, win_probability):
+		""" Adds one (activity, activity other) term of `calc_int_hit` to `values` shaped (6, pairs of agents, ticks) """
+		n_activities = len(list(Activity))
+		attack = self.rules.attack
+		values[Outcome.GAIN_ENERGY] += energy_other * attack.gain_energy_win * win_probability / n_activities
+		values[Outcome.GAIN_RESOURCE] += energy_other * attack.gain_resource_win * win_probability / n_activities
+		values[Outcome.LOSS_ENERGY] += energy * (reachable - win_probability) / n_activities
+		values[Outcome.LOSS_RESOURCE] += energy * attack.loss_resource_lose * (reachable - win_probability) / n_activities
+		values[Outcome.ENEMY_LOSS_ENERGY] += energy_other * win_probability / n_activities
+		values[Outcome.ENEMY_LOSS_RESOURCE] += energy_other * attack.loss_resource_lose * win_probability / n_activities
+
+	@staticmethod
+	def __sum_rows(rows, values, n_rows):
+		""" Sums of `values` shaped (N,) or (N, k) by `rows`, shaped (n_rows,) or (n_rows, k) """
+		if values.ndim == 1:
+			return np.bincount(rows, values, minlength=n_rows)
+
+		return np.stack([np.bincount(rows, v, minlength=n_rows) for v in values.T], axis=1)
+
+	def calc_expected_gain_all(self, hitters, resources):
+		"""
+		Counterpart of `calc_expected_gain_batch` assessing hitters of every team at once, each one against hitters of
+		all the other teams, and resources.
+
+		Only the pairs of agents within the reach distance (see `RulesInterp.get_reach_distance`) get evaluated, and
+		what one side of a fight gains, the other one loses, so each pair of hitters is only evaluated once per
+		(activity, activity other, tick), and the result is reused for both sides.
+
+		:return: scores shaped (len(hitters), len(SubStrategy), len(Activity)), ordered as the enums are
+		"""
+		activities = list(Activity)
+		n_aspects = len(list(SubStrategy))
+
+		if not len(hitters):
+			return np.zeros((0, n_aspects, len(activities)))
+
+		speed = self.rules.movement.speed
+		teams = dict()
+		coord, energy, team, _, _ = ReasoningModel.__to_columns(hitters, teams)
+		coord_res, energy_res, _, _, _ = ReasoningModel.__to_columns(resources, teams)
+		coord_res = coord_res.reshape(len(resources), coord.shape[1])
+
+		ticks = np.arange(1, max(self.rules.ticks_max, 0) + 1, dtype=float)
+		ticks_int = ticks[:-1]
+		n_ticks = np.stack([self.__calc_ticks_available_batch(energy, a) for a in activities])
+		n_ticks_other = self.__calc_ticks_available_batch(energy, None)  # Others are assumed to be moving
+		energy_adjusted = np.stack([self.__calc_energy_before_fight_batch(energy, a, ticks_int) for a in activities])
+		reach = np.stack([(a != Activity.IDLE) * speed * np.minimum(ticks_int[None, :], n_ticks[i][:, None]) for i, a
+			in enumerate(activities)])
+		is_tick_int = ticks_int[None, None, :] <= n_ticks[:, :, None] - 1
+
+		# Pairs farther than the reach distance never interact. The bound is loosened for the rounding of the tree
+		radius = RulesInterp.get_reach_distance(self.rules) * (1 + 1e-9) + 1e-12
+		tree = cKDTree(coord)
+		pairs = tree.query_pairs(radius, p=1, output_type="ndarray").reshape(-1, 2)
+		pairs = pairs[team[pairs[:, 0]] != team[pairs[:, 1]]]
+		pairs_res = tree.sparse_distance_matrix(cKDTree(coord_res), radius, p=1, output_type="ndarray") if \
+			len(resources) else np.zeros(0, dtype=[("i", np.intp), ("j", np.intp)])
+
+		def get_distance_reachable(i, rows, rows_other, distance):
+			""" Distances to the other hitters that can be interacted with, see `__calc_expected_gain_batch` """
+			reachable = (activities[i] != Activity.IDLE) * speed * n_ticks[i][rows] + \
+				speed * np.minimum(n_ticks[i][rows], n_ticks_other[rows_other]) >= distance
+
+			return distance * reachable
+
+		# Interaction probabilities are distances normalized by their sums, which are only known at the end. Gains get
+		# weighted by the distances meanwhile
+		dist_sum = np.zeros(n_ticks.shape)
+		gain_int = np.zeros((len(activities), len(hitters), n_aspects))
+
+		# A chunk of pairs keeps 6 values for each (pair, tick), activity, and direction
+		n_chunk = max(1, ReasoningModel.BATCH_CHUNK_SIZE // (6 * len(activities) * 2 * max(1, len(ticks_int))))
+
+		for begin in range(0, len(pairs), n_chunk):
+			rows, rows_other = pairs[begin:begin + n_chunk].T
+			distance = np.abs(coord[rows] - coord[rows_other]).sum(axis=1)
+			values = [[np.zeros((6, len(rows),) + ticks_int.shape) for _ in activities] for _ in range(2)]
+
+			for (i, a), (i_other, a_other) in itertools.product(enumerate(activities), repeat=2):
+				if Activity.HIT not in [a, a_other]:
+					continue  # No fight, nobody gains, nobody loses
+
+				reachable = (reach[i][rows] + reach[i_other][rows_other] >= distance[:, None]).astype(float)
+				energy_this, energy_other = energy_adjusted[i][rows], energy_adjusted[i_other][rows_other]
+				win_probability = energy_this / (energy_this + energy_other) * reachable
+				self.__accumulate_int_hit(values[0][i], energy_this, energy_other, reachable, win_probability)
+				# The other side of the same fights
+				self.__accumulate_int_hit(values[1][i_other], energy_other, energy_this, reachable,
+					reachable - win_probability)
+
+			for (r, r_other), values_direction in zip([(rows, rows_other,), (rows_other, rows,)], values):
+				for i in range(len(activities)):
+					distance_reachable = get_distance_reachable(i, r, r_other, distance)
+					dist_sum[i] += ReasoningModel.__sum_rows(r, distance_reachable, len(hitters))
+					gain_int[i] += ReasoningModel.__sum_rows(r, np.einsum("spt,p,pt->ps",
+						Outcome.to_scores(values_direction[i]), distance_reachable, is_tick_int[i][r]), len(hitters))
+
+		# Resources are only taken
+		i_take = activities.index(Activity.TAKE)
+
+		for begin in range(0, len(pairs_res), n_chunk):
+			rows, rows_res = pairs_res["i"][begin:begin + n_chunk], pairs_res["j"][begin:begin + n_chunk]
+			distance = np.abs(coord[rows] - coord_res[rows_res]).sum(axis=1)
+			distance_reachable = distance * (speed * n_ticks[i_take][rows] >= distance)
+			outcome = self.__calc_int_take_batch(n_ticks[i_take][rows], energy_res[rows_res][:, None],
+				distance[:, None], ticks_int)
+			dist_sum[i_take] += ReasoningModel.__sum_rows(rows, distance_reachable, len(hitters))
+			gain_int[i_take] += ReasoningModel.__sum_rows(rows, np.einsum("spt,p,pt->ps",
+				Outcome.to_scores(outcome.values[:, :, 0]), distance_reachable, is_tick_int[i_take][rows]), len(hitters))
+
+		gain_int = np.divide(gain_int, dist_sum[:, :, None], out=np.zeros(gain_int.shape), where=dist_sum[:, :, None] != 0)
+
+		res = np.zeros((len(hitters), n_aspects, len(activities)))
+
+		for i, activity in enumerate(activities):
+			scores_mv = Outcome.to_scores(self.calc_mv(None, ticks, activity).values)
+			gain_mv = np.einsum("st,nt->ns", scores_mv, ticks[None, :] <= n_ticks[i][:, None])
+			res[:, :, i] = np.divide(gain_mv + gain_int[i], n_ticks[i][:, None], out=np.zeros(gain_mv.shape),
+				where=n_ticks[i][:, None] > 0)
+
+		Log.debug(self.calc_expected_gain_all, "N hitters:", len(hitters), "N resources:", len(resources), "N pairs:",
+			len(pairs), "N pairs with resources:", len(pairs_res))
+
+		return res
@@ -1,5 +1,11 @@
 from environment import *
+from cache import *
+from ahp import *
 import pickle
+import os
+import collections
+import concurrent.futures
+import itertools
 import matplotlib.pyplot as plt
 
 
@@ -10,9 +16,36 @@ class Simulation:
 	N_RIVAL_TEAMS = 1
 	THIS_TEAM = 1
 
-	def __init__(self, filename=None):
-		self.world = World()
-		self.factory = WorldFactory(
+	def __init__(self, filename=None, batch=True, n_workers=1, native_ahp=True, factory=None, rules=None,
+			seed=None, columnar=False, approximation=None, score_cache=None, skip_depleted=False):
+		"""
+		:param batch: if True, the low-level scores are assessed for the whole team at once, see
+		`ReasoningModel.calc_expected_gain_batch`
+		:param n_workers: if greater than 1, `run` spreads agents across a pool of that many processes
+		:param native_ahp: if True, the team's weights get synthesized at once by `BatchGraph`, instead of running ahpy
+		`Graph` agent by agent
+		:param factory: `WorldFactory` to generate agents with, the default one, if None
+		:param rules: `Rules`, the default ones, if None
+		:param seed: if not None, agents are generated reproducibly, see `WorldFactory.gen_bulk`
+		:param columnar: keep the world's agents in an `AgentTable`
+		:param approximation: `Approximation` to assess agents against samples of rivals with, see `get_score_errors`.
+		Only applies in the batch mode
+		:param score_cache: `ScoreCache` to look the low-level scores up in, before assessing agents, and to store them
+		to afterwards
+		:param skip_depleted: if True, rivals run out of energy are not considered. `Engine` turns it on, since agents
+		only get depleted by ticking the world
+		"""
+		self.seed = seed
+		self.skip_depleted = skip_depleted
+		self.batch = batch
+		self.n_workers = n_workers
+		self.native_ahp = native_ahp
+		self.__scores_cache = dict()  # Agent id -> low-level scores shaped (aspects, activities)
+		self.__errors_cache = dict()  # Agent id -> standard errors of the low-level scores
+		self.score_cache = score_cache
+		self.__score_cache_pending = []  # (key, stacked scores and errors) to store
+		self.__score_cache_context = None  # See `ScoreCache.get_context`, as of the current run
+		self.factory = factory or WorldFactory(
 			world_dim=[8, 8],
 			n_teams=1 + Simulation.N_RIVAL_TEAMS,
 			hitter_energy_mean=5,
@@ -20,7 +53,18 @@ class Simulation:
 			resource_energy_mean=5,
 			resource_energy_deviation=1,
 		)
-		self.reasoning_model = ReasoningModel(Rules(
+		rules = rules or Simulation.get_default_rules()
+		self.world = World(cell_size=RulesInterp.get_reach_distance(rules), columnar=columnar)
+		self.reasoning_model = ReasoningModel(rules, distance=self.world.get_distance, approximation=approximation)
+
+		self.__init_agents(filename)
+		self.__init_rivals()
+		self.__init_pref_graph()
+		self.world.pop_dirty()  # Nothing has been cached yet
+
+	@staticmethod
+	def get_default_rules():
+		return Rules(
 			movement=Rules.Movement(
 				gain_energy_waiting=.02,
 				loss_energy_moving=.05,
@@ -37,18 +81,18 @@ class Simulation:
 				gain_resource=.5,
 			),
 			ticks_max=5
-		))
-
-		self.__init_agents(filename)
-		self.__init_rivals()
-		self.__init_pref_graph()
+		)
 
 	def __init_agents(self, filename):
 		def gen():
-			for _ in range(Simulation.N_RESOURCE):
+			if self.seed is not None:
+				self.factory.populate(self.world, self.N_AGENTS, self.N_RESOURCE, self.seed)
+				return
+
+			for _ in range(self.N_RESOURCE):
 				self.world.add_agent(self.factory.gen_resource())
 
-			for _ in range(Simulation.N_AGENTS):
+			for _ in range(self.N_AGENTS):
 				self.world.add_agent(self.factory.gen_hitter())
 
 		if filename is not None:
@@ -56,24 +100,25 @@ class Simulation:
 				self.world.load(filename)
 			except:
 				gen()
-
-			self.world.save(filename)
+				self.world.save(filename)  # The world gets saved only if it has been generated
 		else:
 			gen()
 
 	def __init_pref_graph(self):
 		self.graph = Graph("strategy")
-		self.graph.set_weights("strategy", ahpy.to_pairwise({
+		self.pref_graph = BatchGraph("strategy")  # Same hierarchy, only the lowest level's weights differ per agent
+
+		self.__set_pref_weights("strategy", ahpy.to_pairwise({
 			Strategy.INVASIVE.value: 2,
 			Strategy.SECURE.value: 100,
 		}))
-		self.graph.set_weights(Strategy.INVASIVE.value, ahpy.to_pairwise({
+		self.__set_pref_weights(Strategy.INVASIVE.value, ahpy.to_pairwise({
 			SubStrategy.ENEMY_RESOURCE_DEPRIVATION.value: 1,
 			SubStrategy.RESOURCE_ACQUISITION.value: 5,
 			SubStrategy.ENEMY_WEAKENING.value: 2,
 			SubStrategy.STRENGTH_GAINING.value: 4,
 		}))
-		self.graph.set_weights(Strategy.SECURE.value, ahpy.to_pairwise({
+		self.__set_pref_weights(Strategy.SECURE.value, ahpy.to_pairwise({
 			SubStrategy.STRENGTH_GAINING.value: 1,
 			SubStrategy.STRENGTH_SAVING.value: 4,
 			SubStrategy.RESOURCE_SAVING.value: 2,
@@ -87,7 +132,11 @@ class Simulation:
 		}
 
 		for aspect in SubStrategy:
-			self.graph.set_weights(aspect.value, ahpy.to_pairwise(action_weights))
+			self.__set_pref_weights(aspect.value, ahpy.to_pairwise(action_weights))
+
+	def __set_pref_weights(self, node, pairwise):
+		self.graph.set_weights(node, pairwise)
+		self.pref_graph.set_weights(node, pairwise)
 
 	def __init_rivals(self):
 		self.rivals = []
@@ -98,37 +147,346 @@ class Simulation:
 				self.rivals.extend(self.world.get_agent(team_id=team_id))
 
 		self.rivals.extend(self.world.get_resources())
+		self.__rival_ids = set(a.id for a in self.rivals)
+		self.__this_team_ids = set(a.id for a in self.this_team)
 
-	def update_secure_to_invasive(self, secure_to_invasive: float):
-		self.graph.set_weights("strategy", {(Strategy.SECURE.value, Strategy.INVASIVE.value,): secure_to_invasive})
+	def __is_rival(self, agent):
+		""" Rivals run out of energy are not worth considering, if `skip_depleted` """
+		return agent.id in self.__rival_ids and (not self.skip_depleted or agent.energy > 0)
 
-	def _assess_weights(self, agent, agents_other):
-		for aspect in SubStrategy:
-			scores = dict()
+	def _get_rivals_near(self, agent):
+		""" Rivals and resources which `agent` may possibly reach within an iteration """
+		radius = RulesInterp.get_reach_distance(self.reasoning_model.rules)
+
+		return [a for a in self.world.get_agents_near(agent.coord, radius) if self.__is_rival(a)]
 
+	def _calc_scores(self, agent):
+		""" Low-level scores of `agent` shaped (aspects, activities) """
+		agents_other = self._get_rivals_near(agent)
+		energy_table = FightEnergyTable(self.reasoning_model.rules)
+		gains = [self.reasoning_model.calc_expected_gains(agent, agents_other, activity, energy_table) for activity in
+			Activity]
+
+		return np.array([[g[aspect] for g in gains] for aspect in SubStrategy])
+
+	def _calc_scores_batch(self, agents, errors=None):
+		"""
+		Low-level scores of `agents` shaped (agents, aspects, activities)
+
+		:param errors: array shaped as the scores, if not None, gets their standard errors
+		"""
+		scores = np.zeros((len(agents), len(list(SubStrategy)), len(list(Activity))))
+		position = {agent.id: i for i, agent in enumerate(agents)}
+		radius = RulesInterp.get_reach_distance(self.reasoning_model.rules)
+
+		# Rivals that are too far to be reached by any agent from a neighbourhood are not worth considering
+		for group, candidates in self.world.get_neighbourhoods(agents, radius):
+			rivals = [a for a in candidates if self.__is_rival(a)]
+			rows = [position[a.id] for a in group]
+			group_errors = None if errors is None else np.zeros((len(group),) + errors.shape[1:])
+			scores[rows] = self.reasoning_model.calc_expected_gain_batch(group, rivals, group_errors)
+
+			if errors is not None:
+				errors[rows] = group_errors
+
+		return scores
+
+	def update_secure_to_invasive(self, secure_to_invasive: float):
+		self.__set_pref_weights("strategy", {(Strategy.SECURE.value, Strategy.INVASIVE.value,): secure_to_invasive})
+
+	def _assess_weights(self, agent, agents_other, activity_scores=None):
+		"""
+		:param activity_scores: precomputed low-level scores shaped (aspects, activities), see
+		`ReasoningModel.calc_expected_gain_batch`
+		"""
+		if activity_scores is None:
+			energy_table = FightEnergyTable(self.reasoning_model.rules)
+			gains = [self.reasoning_model.calc_expected_gains(agent, agents_other, activity, energy_table) for activity in
+				Activity]
+			activity_scores = np.array([[g[aspect] for g in gains] for aspect in SubStrategy])
+
+		for i, aspect in enumerate(SubStrategy):
 			# Assess situation locally within a given context
-			for activity in Activity:
-				score = self.reasoning_model.calc_expected_gain(agent, agents_other, aspect, activity)
-				scores[activity.value] = score + .001  # Prevent 0 division
+			scores = dict([(activity.value, float(activity_scores[i, j]) + .001,) for j, activity in enumerate(Activity)])  # Prevent 0 division
 
 			# Convolve low-level scores up to the global (strategic) goal
-			Log.debug(self._assess_weights, "agent id.:", agent.id, "aspect:", aspect.value, "scores:", scores)
+			if __debug__:
+				Log.debug(self._assess_weights, "agent id.:", agent.id, "aspect:", aspect.value, "scores:", scores)
+
 			self.graph.set_weights(aspect.value, ahpy.to_pairwise(scores))
 
 		return self.graph.get_weights()  # regarding the root node
 
+	def _synthesize(self, agents, scores):
+		"""
+		:param scores: low-level scores shaped (agents, aspects, activities)
+		:return: weights of the activities regarding the root node, for each agent
+		"""
+		if not self.native_ahp:
+			return [self._assess_weights(agent, None, agent_scores) for agent, agent_scores in zip(agents, scores)]
+
+		priorities = calc_priorities(to_pairwise_matrix(scores + .001))  # Prevent 0 division
+		weights = self.pref_graph.get_weights_batch([aspect.value for aspect in SubStrategy], priorities)
+
+		return [dict(zip([activity.value for activity in Activity], map(float, w))) for w in weights]
+
+	def _get_groups(self, agents):
+		""" Splits agents into groups that get assessed independently from each other """
+		if self.batch:
+			radius = RulesInterp.get_reach_distance(self.reasoning_model.rules)
+			return [group for group, _ in self.world.get_neighbourhoods(agents, radius)]
+		else:
+			return [[agent] for agent in agents]
+
+	def _assess_group(self, agents):
+		""" Low-level scores of `agents` shaped (agents, aspects, activities), and their standard errors """
+		errors = np.zeros((len(agents), len(list(SubStrategy)), len(list(Activity))))
+
+		if self.batch:
+			return self._calc_scores_batch(agents, errors), errors
+		else:
+			return np.array([self._calc_scores(a) for a in agents]).reshape(errors.shape), errors
+
+	def invalidate_scores(self, agent_ids=None):
+		"""
+		Low-level scores depend on the world and the rules only, so they are cached across runs, and changing the
+		preference graph (e.g. `update_secure_to_invasive`) only re-runs the synthesis. `run` picks up the changes made
+		through `World.update_agent` by itself, see `invalidate_dirty`. Whatever else changes the world or the rules
+		should drop the scores affected.
+
+		:param agent_ids: if None, drops every score
+		"""
+		if agent_ids is None:
+			self.__scores_cache.clear()
+			self.__errors_cache.clear()
+		else:
+			for agent_id in agent_ids:
+				self.__scores_cache.pop(agent_id, None)
+				self.__errors_cache.pop(agent_id, None)
+
+	def invalidate_dirty(self):
+		"""
+		Drops the scores of the agents which have changed since the previous call, and of those whose reachable
+		neighbourhood a changed agent has left or entered. See `World.pop_dirty`
+		"""
+		agent_ids, coord_before, coord = self.world.pop_dirty()
+
+		if len(agent_ids) >= len(self.this_team):
+			self.invalidate_scores()  # Cheaper to start over
+			return
+
+		radius = RulesInterp.get_reach_distance(self.reasoning_model.rules)
+		affected = set(i for i in agent_ids.tolist() if i in self.__this_team_ids)
+
+		for c in set(map(tuple, np.concatenate([coord_before, coord]).tolist())):
+			affected.update(a.id for a in self.world.get_agents_near(c, radius) if a.id in self.__this_team_ids)
+
+		Log.debug(self.invalidate_dirty, "N changed:", len(agent_ids), "N affected:", len(affected))
+		self.invalidate_scores(affected)
+
+	def __assess_groups_parallel(self, groups):
+		"""
+		Yields the groups' assessments in order, as they complete. Only a few chunks of groups per worker are in flight
+		at once, so neither the tasks, nor the results pile up, when those get consumed slowly
+		"""
+		chunk_size = max(1, len(groups) // (4 * self.n_workers))
+		chunks = ([[a.id for a in g] for g in groups[begin:begin + chunk_size]] for begin in range(0, len(groups),
+			chunk_size))
+		pending = collections.deque()
+
+		# Each worker gets its own copy of the simulation
+		with concurrent.futures.ProcessPoolExecutor(self.n_workers, initializer=_init_worker, initargs=(self,)) as executor:
+			for chunk in itertools.chain(chunks, [None]):
+				if chunk is not None:
+					pending.append(executor.submit(_assess_groups_worker, chunk))
+
+				while pending and (chunk is None or len(pending) >= 2 * self.n_workers):
+					yield from pending.popleft().result()
+
+	def __assess_groups(self, groups):
+		if self.n_workers > 1 and len(groups) > 1:
+			return self.__assess_groups_parallel(groups)
+		else:
+			return map(self._assess_group, groups)
+
 	def run(self):
 		Log.info(self.run, "N this team:", len(self.this_team), "N rivals and resources:", len(self.rivals))
-		res = []
+		self.invalidate_dirty()
+		groups = self._get_groups(self.__load_cached([a for a in self.this_team if a.id not in self.__scores_cache]))
+
+		for group, assessed in zip(groups, list(self.__assess_groups(groups))):
+			self.__cache_group(group, assessed)
+
+		self.__store_cached()
+
+		scores = np.array([self.__scores_cache[a.id] for a in self.this_team]).reshape(len(self.this_team),
+			len(list(SubStrategy)), len(list(Activity)))
+		res = self._synthesize(self.this_team, scores)
+
+		for agent, weights in zip(self.this_team, res):
+			Log.info(self.run, "agent id.:", agent.id, "scores:", weights, "@sim")
+
+		return res
+
+	def run_iter(self, sinks=(), chunk_size=1024):
+		"""
+		Streaming counterpart of `run`. Yields (agent id, weights) as soon as the agent's group gets assessed, so only
+		one group's weights are held at once. Agents whose scores are cached come first, in chunks of `chunk_size`.
+		Scores go to the `score_cache` group by group.
+
+		:param sinks: each group's results get written to those (e.g. `JsonlSink`), and flushed, before being yielded.
+		If there are any, the scores assessed are not kept in memory (see `get_cached_scores`)
+		"""
+		Log.info(self.run_iter, "N this team:", len(self.this_team), "N rivals and resources:", len(self.rivals))
+		self.invalidate_dirty()
+		groups = self._get_groups(self.__load_cached([a for a in self.this_team if a.id not in self.__scores_cache]))
+		cached = [a for a in self.this_team if a.id in self.__scores_cache]
+
+		for begin in range(0, len(cached), chunk_size):
+			agents = cached[begin:begin + chunk_size]
+			yield from self.__emit(agents, [self.__scores_cache[a.id] for a in agents], sinks)
+
+		try:
+			for group, assessed in zip(groups, self.__assess_groups(groups)):
+				self.__cache_group(group, assessed, keep=not sinks)
+				self.__store_cached()
+				yield from self.__emit(group, assessed[0], sinks)
+		finally:
+			self.__store_cached()
+
+	def __cache_group(self, group, assessed, keep=True):
+		"""
+		:param keep: whether to keep the scores in memory too. Those go to the `score_cache` anyway
+		"""
+		group_scores, group_errors = assessed
+
+		if keep:
+			self.__scores_cache.update(zip([a.id for a in group], group_scores))
+			self.__errors_cache.update(zip([a.id for a in group], group_errors))
+
+		if self.score_cache is not None:
+			self.__score_cache_pending.extend((self.__score_cache_key(a.id), np.stack(s),) for a, s in zip(group,
+				zip(group_scores, group_errors)))
+
+	def get_score_context(self):
+		""" Hash of whatever the low-level scores depend on, apart from the agent, see `ScoreCache.get_context` """
+		approximation = self.reasoning_model.approximation
 
-		for agent in self.this_team:
-			scores = self._assess_weights(agent, self.rivals)
-			Log.info(self.run, "agent id.:", agent.id, "scores:", scores, "@sim")
-			res.append(scores)
+		return ScoreCache.get_context(self.world, self.reasoning_model.rules, batch=self.batch,
+			approximation=None if approximation is None else dataclasses.asdict(approximation),
+			this_team=Simulation.THIS_TEAM, n_rival_teams=Simulation.N_RIVAL_TEAMS, skip_depleted=self.skip_depleted)
+
+	def __load_cached(self, agents):
+		"""
+		Looks `agents`' scores up in the score cache
+
+		:return: agents which have not been found
+		"""
+		self.__score_cache_context = None
+
+		if self.score_cache is None or not len(agents):
+			return agents
+
+		self.__score_cache_context = self.get_score_context()
+		keys = [self.__score_cache_key(a.id) for a in agents]
+		found = self.score_cache.get_many(keys)
+
+		for agent, key in zip(agents, keys):
+			if key in found:
+				self.__scores_cache[agent.id], self.__errors_cache[agent.id] = found[key]
+
+		Log.info(self.__load_cached, "N looked up:", len(agents), "N found:", len(found))
+
+		return [a for a, key in zip(agents, keys) if key not in found]
+
+	def __score_cache_key(self, agent_id):
+		return ScoreCache.get_key(self.__score_cache_context, agent_id)
+
+	def __store_cached(self):
+		if self.__score_cache_pending:
+			self.score_cache.put_many(self.__score_cache_pending)
+			self.__score_cache_pending = []
+
+	def __emit(self, agents, scores, sinks):
+		scores = np.array(scores).reshape(len(agents), len(list(SubStrategy)), len(list(Activity)))
+		res = list(zip([a.id for a in agents], self._synthesize(agents, scores)))
+
+		for sink in sinks:
+			for agent_id, weights in res:
+				sink.write(agent_id, weights)
+
+			sink.flush()
+
+		return res
+
+	def load(self, filename):
+		""" Replaces the world with one from a file, see `World.load`. Scores cached in memory get dropped """
+		self.world.load(filename)
+		self.__init_rivals()
+		self.invalidate_scores()
+		self.world.pop_dirty()
+
+	def get_cached_scores(self):
+		""" {agent id: (low-level scores, their standard errors)} cached in memory """
+		return dict((i, (scores, self.__errors_cache[i],)) for i, scores in self.__scores_cache.items())
+
+	def set_cached_scores(self, scores: dict):
+		""" Puts scores as `get_cached_scores` gives them into the memory cache """
+		for agent_id, (agent_scores, errors) in scores.items():
+			self.__scores_cache[agent_id] = agent_scores
+			self.__errors_cache[agent_id] = errors
+
+	def get_score_errors(self):
+		"""
+		Standard errors of the low-level scores `run` has used, shaped (agents, aspects, activities). Those are zeros,
+		unless the simulation approximates, see `Approximation`
+		"""
+		return np.array([self.__errors_cache[a.id] for a in self.this_team]).reshape(len(self.this_team),
+			len(list(SubStrategy)), len(list(Activity)))
+
+	def run_all_teams(self):
+		"""
+		Counterpart of `run` for every team at once, where all the other teams are rivals. Low-level scores are
+		computed from scratch by `ReasoningModel.calc_expected_gain_all`, and are not cached.
+
+		:return: {team id: weights of the activities for each of the team's agents, ordered as `get_agent` returns them}
+		"""
+		teams = [t for t in range(0, Simulation.N_RIVAL_TEAMS + 1) if self.world.get_agent(team_id=t)]
+		hitters = [a for t in teams for a in self.world.get_agent(team_id=t)]
+		resources = [a for a in self.world.get_resources() if not self.skip_depleted or a.energy > 0]
+		alive = [a for a in hitters if not self.skip_depleted or a.energy > 0]
+		Log.info(self.run_all_teams, "N teams:", len(teams), "N hitters:", len(hitters), "N resources:", len(resources))
+		scores = dict(zip([a.id for a in alive], self.reasoning_model.calc_expected_gain_all(alive, resources)))
+
+		# Hitters run out of energy are not worth considering as rivals, if `skip_depleted`, but still get assessed
+		for agent in hitters:
+			if self.skip_depleted and agent.energy <= 0:
+				rivals = [a for a in alive if a.team != agent.team] + resources
+				scores[agent.id] = self.reasoning_model.calc_expected_gain_batch([agent], rivals)[0]
+
+		res = dict()
+
+		for team_id in teams:
+			team = self.world.get_agent(team_id=team_id)
+			res[team_id] = self._synthesize(team, np.array([scores[a.id] for a in team]))
 
 		return res
 
 
+_worker_simulation = None
+
+
+def _init_worker(simulation: Simulation):
+	global _worker_simulation
+	_worker_simulation = simulation
+
+
+def _assess_groups_worker(groups):
+	""" :param groups: agent ids of each group """
+	return [_worker_simulation._assess_group([_worker_simulation.world.get_agent(agent_id=i) for i in agent_ids]) for
+		agent_ids in groups]
+
+
 def hist_action(res: dict):
 
 	hist = dict()
@@ -144,14 +502,49 @@ def hist_action(res: dict):
 	return hist
 
 
-def get_action_data(simulation: Simulation):
+CHECKPOINT_VERSION = 2  # See `get_action_data`
 
-	activities = dict([(a.value, [],) for a in Activity])
-	activities['x'] = []
 
-	for i in range(1, 1000, 10):
-		s2i = i / 100
-		simulation.update_secure_to_invasive(s2i)
+def get_action_data(simulation: Simulation, adaptive=False, s2i_min=.01, s2i_max=9.91, n_initial=8, tolerance=1e-3,
+		log_scale=False, checkpoint=None):
+	"""
+	Histograms of the agents' preferred actions over a sweep of the secure / invasive ratio.
+
+	:param adaptive: if False, the ratio runs over a fixed grid of 100 points. Otherwise, only the ratios where some
+	agent's preferred action changes get searched for, see `get_action_breakpoints`. The histogram is then given at the
+	start of each piece it stays constant over (but taken in its middle, off the ties), and at `s2i_max`
+	:param checkpoint: file to save the progress to after each point of the sweep. If it exists, the sweep resumes
+	from the point it has stopped at, with the world, the low-level scores and the random states restored. Delete it
+	(and the files next to it, named after it) to start over. A checkpoint of another sweep, or of a simulation with
+	another `get_score_context`, raises ValueError
+	:return: {activity: [N agents], 'x': [ratio]}
+	"""
+	sweep = dict(adaptive=adaptive, s2i_min=s2i_min, s2i_max=s2i_max, n_initial=n_initial, tolerance=tolerance,
+		log_scale=log_scale)
+	state = None if checkpoint is None else _load_checkpoint(checkpoint, simulation, sweep)
+
+	if state is None:
+		activities = dict([(a.value, [],) for a in Activity])
+		activities['x'] = []
+
+		if adaptive:
+			xs = get_action_breakpoints(simulation, s2i_min, s2i_max, n_initial, tolerance, log_scale) + [s2i_max]
+			xs_run = [(x + x_next) / 2 for x, x_next in zip(xs[:-1], xs[1:])] + [s2i_max]
+		else:
+			xs = [i / 100 for i in range(1, 1000, 10)]
+			xs_run = xs
+
+		state = dict(version=CHECKPOINT_VERSION, sweep=sweep, xs=xs, xs_run=xs_run, activities=activities,
+			world=simulation.world.get_digest(), context=simulation.get_score_context())
+
+		if checkpoint is not None:
+			_dump_atomic(simulation.world, checkpoint + ".world")
+
+	activities = state["activities"]
+	n_scores_saved = len(simulation.get_cached_scores()) if len(activities['x']) else None
+
+	for s2i, s2i_run in list(zip(state["xs"], state["xs_run"]))[len(activities['x']):]:
+		simulation.update_secure_to_invasive(s2i_run)
 		hist = hist_action(simulation.run())
 
 		for activity in Activity:
@@ -159,15 +552,172 @@ def get_action_data(simulation: Simulation):
 
 		activities['x'].append(s2i)
 
+		if checkpoint is not None:
+			scores = simulation.get_cached_scores()
+
+			if len(scores) != n_scores_saved:  # Scores only get assessed once per sweep, unless the world changes
+				_dump_atomic(scores, checkpoint + ".scores")
+				n_scores_saved = len(scores)
+
+			state.update(random_state=random.getstate())
+			_dump_atomic(state, checkpoint)
+
 	return activities
 
 
+def _dump_atomic(data, filename):
+	""" Either the whole of `data` gets saved, or the file stays as it has been. `World`s are saved by `World.save` """
+	temporary = f"{filename}.{os.getpid()}.tmp"
+
+	try:
+		if isinstance(data, World):
+			data.save(temporary, binary=data.get_table() is not None)
+		else:
+			with open(temporary, 'wb') as f:
+				pickle.dump(data, f)
+
+		with open(temporary, 'rb') as f:
+			os.fsync(f.fileno())
+
+		os.replace(temporary, filename)
+		directory = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+
+		try:
+			os.fsync(directory)  # The rename itself is only durable once the directory is
+		finally:
+			os.close(directory)
+	finally:
+		if os.path.exists(temporary):
+			os.remove(temporary)
+
+
+def _load_checkpoint(filename, simulation: Simulation, sweep):
+	""" Sweep state saved by `get_action_data`, or None, if there is none yet. Restores the world and random states """
+	if not os.path.exists(filename):
+		return None
+
+	state = load_action_data(filename)
+
+	if state.get("version") != CHECKPOINT_VERSION or state["sweep"] != sweep:
+		raise ValueError(f"{filename} is a checkpoint of another sweep: {state.get('sweep')}")
+
+	if simulation.world.get_digest() != state["world"]:
+		simulation.load(filename + ".world")
+
+	if simulation.get_score_context() != state["context"]:
+		raise ValueError(f"{filename} is a checkpoint of a simulation with other rules, or assessment parameters")
+
+	if os.path.exists(filename + ".scores"):
+		simulation.set_cached_scores(load_action_data(filename + ".scores"))
+
+	if "random_state" in state:
+		random.setstate(state["random_state"])
+
+	Log.info(_load_checkpoint, "resuming from", filename, "N points done:", len(state["activities"]['x']), "of",
+		len(state["xs"]))
+
+	return state
+
+
+def get_action_breakpoints(simulation: Simulation, s2i_min, s2i_max, n_initial=8, tolerance=1e-3, log_scale=False):
+	"""
+	Finds the secure / invasive ratios where any agent's preferred action changes.
+
+	The ratio r only weights the strategies against each other, so each agent's weights of the activities are linear in
+	p = r / (1 + r). Runs at the ends of the range give those lines, and the changes are exactly where the top line of
+	some agent does. If a run in the middle does not confirm the linearity, e.g. because of rounding, the range is split
+	into `n_initial` intervals instead, and those with different actions at the ends get bisected until they are
+	`tolerance` wide. Changes that get reverted within one initial interval are not noticed then.
+
+	:param log_scale: if True, the bisection and `tolerance` apply to the log of the ratio
+	:return: [s2i_min, ratio of each change, ...], i.e. the start of each piece the actions stay constant over
+	"""
+
+	def get_weights(s2i):
+		simulation.update_secure_to_invasive(s2i)
+
+		return np.array([[r[a.value] for a in Activity] for r in simulation.run()]).reshape(-1, len(list(Activity)))
+
+	p_min, p_max = s2i_min / (1 + s2i_min), s2i_max / (1 + s2i_max)
+	p_middle = (p_min + p_max) / 2
+	weights_min, weights_max = get_weights(s2i_min), get_weights(s2i_max)
+	slopes = (weights_max - weights_min) / (p_max - p_min)
+
+	if np.allclose(get_weights(p_middle / (1 - p_middle)), weights_min + slopes * (p_middle - p_min), rtol=0, atol=1e-9):
+		changes = set()
+
+		for intercepts, agent_slopes in zip(weights_min, slopes):
+			changes.update(_get_top_changes(intercepts, agent_slopes, p_max - p_min))
+
+		res = [s2i_min] + [p / (1 - p) for p in sorted(p_min + c for c in changes)]
+		Log.info(get_action_breakpoints, "N breakpoints:", len(res) - 1, "N runs:", 3)
+
+		return res
+
+	transform, inverse = (math.log, math.exp,) if log_scale else (float, float,)
+	u_min, u_max = transform(s2i_min), transform(s2i_max)
+	actions = dict()
+
+	def get_actions(u):
+		if u not in actions:
+			actions[u] = np.argmax(get_weights(inverse(u)), axis=-1).tolist()
+
+		return actions[u]
+
+	bounds = [u_min + (u_max - u_min) * i / n_initial for i in range(n_initial)] + [u_max]
+	intervals = list(zip(bounds[:-1], bounds[1:]))
+	res = [s2i_min]
+
+	while intervals:
+		begin, end = intervals.pop()
+
+		if get_actions(begin) == get_actions(end):
+			continue
+		elif end - begin <= tolerance:
+			res.append(inverse(end))
+		else:
+			middle = (begin + end) / 2
+			intervals.extend([(middle, end,), (begin, middle,)])
+
+	Log.info(get_action_breakpoints, "N breakpoints:", len(res) - 1, "N runs:", 3 + len(actions))
+
+	return sorted(res)
+
+
+def _get_top_changes(intercepts, slopes, length):
+	""" Positions in (0; length) where the top one of lines `intercepts + slopes * x` changes """
+	top = int(np.argmax(intercepts))
+	x = 0
+	res = []
+
+	while True:
+		# Only steeper lines may overtake the top one, each step the slope grows, so there are at most N lines steps
+		rising = np.flatnonzero(slopes > slopes[top])
+
+		if not len(rising):
+			break
+
+		crossings = np.maximum((intercepts[top] - intercepts[rising]) / (slopes[rising] - slopes[top]), x)
+		x_next = crossings.min()
+		top = int(rising[crossings == x_next][np.argmax(slopes[rising][crossings == x_next])])
+
+		if x_next >= length:
+			break
+		elif x_next > 0:
+			res.append(float(x_next))
+
+		x = x_next
+
+	return res
+
+
 def save_action_data(data, filename):
-	pickle.dump(data, open(filename, 'wb'))
+	_dump_atomic(data, filename)
 
 
 def load_action_data(filename):
-	return pickle.load(open(filename, 'rb'))
+	with open(filename, 'rb') as f:
+		return pickle.load(f)
 
 
 def print_action_data(action_data):
@@ -183,8 +733,13 @@ def print_action_data(action_data):
 	plt.show()
 
 
-def prepared_init():
-	simulation = Simulation()
+def prepared_init(filename=None, score_cache_filename=None):
+	"""
+	:param filename: world file, see `Simulation`
+	:param score_cache_filename: if not None, the low-level scores are reused across calls, see `ScoreCache`
+	"""
+	simulation = Simulation(filename=filename,
+		score_cache=None if score_cache_filename is None else ScoreCache(score_cache_filename))
 	action_data = get_action_data(simulation)
 	save_action_data(action_data, "action")
 	print(action_data)
@@ -0,0 +1,110 @@
+from reasoning_model import *
+import json
+import os
+import struct
+
+
+class JsonlSink:
+	"""
+	Appends (agent id, weights) results, e.g. of `Simulation.run_iter`, to a JSON Lines file, one
+	{"id": ..., "weights": {activity: weight}} object per line
+	"""
+
+	def __init__(self, filename, append=False):
+		self.filename = filename
+		self.file = open(filename, 'a' if append else 'w')
+
+	def write(self, agent_id, weights: dict):
+		self.file.write(json.dumps(dict(id=int(agent_id), weights=weights)) + '\n')
+
+	def flush(self):
+		self.file.flush()
+
+	def close(self):
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	@staticmethod
+	def read(filename):
+		""" Yields (agent id, weights) """
+		with open(filename, 'r') as f:
+			for line in f:
+				record = json.loads(line)
+
+				yield record["id"], record["weights"]
+
+
+class BinarySink:
+	"""
+	Appends (agent id, weights) results to a binary file: a fixed header followed by fixed-size records of an id and
+	the weights in `Activity` order. Records are buffered up to `BUFFER_SIZE`, and can be memory-mapped by `read`.
+	"""
+
+	MAGIC = b"AHPR"
+	VERSION = 1
+	HEADER = struct.Struct("<4sII")  # Magic, version, N activities
+	RECORD = np.dtype([("id", "<i8"), ("weights", "<f8", (len(list(Activity)),))])
+	BUFFER_SIZE = 4096
+
+	def __init__(self, filename, append=False):
+		self.filename = filename
+		self.__buffer = np.zeros(BinarySink.BUFFER_SIZE, dtype=BinarySink.RECORD)
+		self.__n_buffered = 0
+
+		if append:
+			BinarySink.__read_header(filename)
+			self.file = open(filename, 'ab')
+		else:
+			self.file = open(filename, 'wb')
+			self.file.write(BinarySink.HEADER.pack(BinarySink.MAGIC, BinarySink.VERSION, len(list(Activity))))
+
+	def write(self, agent_id, weights: dict):
+		record = self.__buffer[self.__n_buffered]
+		record["id"] = agent_id
+		record["weights"] = [weights[activity.value] for activity in Activity]
+		self.__n_buffered += 1
+
+		if self.__n_buffered == len(self.__buffer):
+			self.flush()
+
+	def flush(self):
+		self.file.write(self.__buffer[:self.__n_buffered].tobytes())
+		self.file.flush()
+		self.__n_buffered = 0
+
+	def close(self):
+		self.flush()
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	@staticmethod
+	def __read_header(filename):
+		with open(filename, 'rb') as f:
+			magic, version, n_activities = BinarySink.HEADER.unpack(f.read(BinarySink.HEADER.size))
+
+		if magic != BinarySink.MAGIC:
+			raise ValueError(f"{filename} is not a results file")
+
+		if version != BinarySink.VERSION or n_activities != len(list(Activity)):
+			raise ValueError(f"{filename}: unsupported results file version {version}, N activities {n_activities}")
+
+	@staticmethod
+	def read(filename):
+		""" Memory-mapped records with fields "id" and "weights" (in `Activity` order). Complete records only """
+		BinarySink.__read_header(filename)
+		n_records = (os.path.getsize(filename) - BinarySink.HEADER.size) // BinarySink.RECORD.itemsize
+
+		if not n_records:
+			return np.zeros(0, dtype=BinarySink.RECORD)
+
+		return np.memmap(filename, dtype=BinarySink.RECORD, mode='r', offset=BinarySink.HEADER.size, shape=(n_records,))
@@ -0,0 +1,255 @@
+"""
+Benchmarks of the reasoning and simulation hot paths.
+
+Runs each benchmark across a scaling grid of agent count, resource count, `ticks_max` and world size, dumps the timings
+as JSON, and, optionally, compares them against a baseline saved by a previous run:
+
+	python bench/bench.py --output bench.json
+	python bench/bench.py --grid full --baseline bench.json --output bench_new.json
+"""
+
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "ahpcoord"))
+
+from simulation import *
+from generic import Log
+import argparse
+import dataclasses
+import itertools
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+
+
+GRIDS = {
+	# Base point first. "quick" varies one axis at a time, "full" takes the product
+	"quick": dict(n_agents=[50, 200], n_resources=[20, 80], ticks_max=[5, 10], world_size=[8, 16]),
+	"full": dict(n_agents=[50, 200, 800], n_resources=[20, 80, 320], ticks_max=[5, 10, 20], world_size=[8, 16, 32]),
+}
+
+
+def make_grid(axes: dict, full=False):
+	""" List of parameter dicts """
+	base = dict((k, v[0],) for k, v in axes.items())
+
+	if full:
+		return [dict(zip(axes.keys(), values)) for values in itertools.product(*axes.values())]
+
+	res = [base]
+
+	for k, values in axes.items():
+		res.extend(dict(base, **{k: v}) for v in values[1:])
+
+	return res
+
+
+def make_simulation(n_agents, n_resources, ticks_max, world_size, seed=0):
+	""" Seeded `Simulation` of a given scale. Scores are not cached """
+	random.seed(seed)
+	simulation_type = type("BenchSimulation", (Simulation,), dict(N_AGENTS=n_agents, N_RESOURCE=n_resources))
+	factory = WorldFactory(world_dim=[world_size, world_size], n_teams=1 + Simulation.N_RIVAL_TEAMS,
+		hitter_energy_mean=5, hitter_energy_deviation=1, resource_energy_mean=5, resource_energy_deviation=1)
+	rules = dataclasses.replace(Simulation.get_default_rules(), ticks_max=ticks_max)
+
+	return simulation_type(factory=factory, rules=rules)
+
+
+def make_team_simulations(simulation: Simulation):
+	""" Simulations over the world of `simulation`, one per team, each assessing its team by `Simulation.run` """
+	agent_id, coord, energy, agent_type, team = simulation.world.get_columns()
+	res = []
+
+	with tempfile.TemporaryDirectory() as directory:
+		for team_id in range(0, Simulation.N_RIVAL_TEAMS + 1):
+			if team_id == Simulation.THIS_TEAM:
+				res.append(simulation)
+				continue
+
+			# Swaps the team with this one
+			world = World()
+			world.add_columns(agent_id, coord, energy, agent_type, np.where(team == team_id, Simulation.THIS_TEAM,
+				np.where(team == Simulation.THIS_TEAM, team_id, team)))
+			world.save(os.path.join(directory, "world"))
+			res.append(type(simulation)(filename=os.path.join(directory, "world"), factory=simulation.factory,
+				rules=simulation.reasoning_model.rules))
+
+	return res
+
+
+def measure(fn, repeat=5, min_time=.05):
+	"""
+	Calls `fn` in batches lasting at least `min_time` seconds.
+
+	:return: {"best": s per call, "mean": s per call, "n_calls": calls per batch, "repeat": N batches}
+	"""
+	n_calls = 1
+
+	while True:
+		begin = time.perf_counter()
+
+		for _ in range(n_calls):
+			fn()
+
+		elapsed = time.perf_counter() - begin
+
+		if elapsed >= min_time or n_calls >= 1 << 20:
+			break
+
+		n_calls *= 2 if elapsed <= 0 else max(2, int(min_time / elapsed * 1.2))
+
+	samples = [elapsed / n_calls]
+
+	for _ in range(repeat - 1):
+		begin = time.perf_counter()
+
+		for _ in range(n_calls):
+			fn()
+
+		samples.append((time.perf_counter() - begin) / n_calls)
+
+	return dict(best=min(samples), mean=sum(samples) / len(samples), n_calls=n_calls, repeat=repeat)
+
+
+def gen_cases(simulation: Simulation):
+	""" Yields (benchmark name, parameters it depends on, callable) """
+	rules = simulation.reasoning_model.rules
+	model = simulation.reasoning_model
+	agent = simulation.this_team[0]
+	rivals = [a for a in simulation.rivals if a.type == Agent.Type.HITTER]
+	agent_other = rivals[0]
+	situation = Situation(agent=agent, agent_other=agent_other, activity=Activity.HIT, activity_other=Activity.RUN,
+		ticks=rules.ticks_max)
+	rules_params = ["ticks_max"]
+
+	yield "RulesInterp.get_distance", [], lambda: RulesInterp.get_distance(rules, situation)
+	yield "RulesInterp.is_reachable", rules_params, lambda: RulesInterp.is_reachable(rules, situation)
+	yield "RulesInterp.get_energy_delta_movement", rules_params, \
+		lambda: RulesInterp.get_energy_delta_movement(rules, situation)
+	yield "RulesInterp.get_energy_before_fight", rules_params, \
+		lambda: RulesInterp.get_energy_before_fight(rules, situation)
+	yield "ReasoningModel.calc_int_hit", rules_params, \
+		lambda: model.calc_int_hit(agent, rules.ticks_max, Activity.HIT, agent_other)
+	yield "ReasoningModel.calc_expected_gain", None, \
+		lambda: model.calc_expected_gain(agent, simulation.rivals, SubStrategy.ENEMY_WEAKENING, Activity.HIT)
+	yield "Simulation._assess_weights", None, lambda: simulation._assess_weights(agent, simulation.rivals)
+
+	def run():
+		simulation.invalidate_scores()
+		simulation.run()
+
+	yield "Simulation.run", None, run
+
+	team_simulations = make_team_simulations(simulation)
+
+	def run_per_team():
+		for team_simulation in team_simulations:
+			team_simulation.invalidate_scores()
+			team_simulation.run()
+
+	# The two should be compared to each other
+	yield "Simulation.run per team", None, run_per_team
+	yield "Simulation.run_all_teams", None, simulation.run_all_teams
+
+	def action_data():
+		simulation.invalidate_scores()
+		get_action_data(simulation)
+
+	yield "get_action_data", None, action_data
+
+
+def run_benchmarks(grid, repeat=5, min_time=.05, names=None):
+	"""
+	:param names: only run benchmarks whose names contain any of these substrings
+	:return: list of records {"name", "params", "best", "mean", "n_calls", "repeat"}
+	"""
+	res = []
+	done = set()
+
+	for params in grid:
+		simulation = make_simulation(**params)
+
+		for name, depends_on, fn in gen_cases(simulation):
+			if names and not any(n in name for n in names):
+				continue
+
+			case_params = dict((k, params[k],) for k in (params.keys() if depends_on is None else depends_on))
+			key = get_key(name, case_params)
+
+			if key in done:
+				continue
+
+			done.add(key)
+			record = dict(name=name, params=case_params, **measure(fn, repeat, min_time))
+			res.append(record)
+			print(f"{key:<100} {record['best'] * 1e6:>14.2f} us", flush=True)
+
+	return res
+
+
+def get_key(name, params):
+	return name + "".join(f" {k}={v}" for k, v in sorted(params.items()))
+
+
+def compare(results, baseline, threshold=.1):
+	"""
+	Matches records by name and parameters.
+
+	:param threshold: relative change of the best time that is considered significant
+	:return: list of (key, baseline best, best, ratio, verdict), verdict is one of "faster", "slower", "same"
+	"""
+	baseline = dict((get_key(r["name"], r["params"]), r,) for r in baseline["results"])
+	res = []
+
+	for record in results:
+		key = get_key(record["name"], record["params"])
+
+		if key not in baseline:
+			continue
+
+		ratio = record["best"] / baseline[key]["best"]
+		verdict = "slower" if ratio > 1 + threshold else "faster" if ratio < 1 - threshold else "same"
+		res.append((key, baseline[key]["best"], record["best"], ratio, verdict,))
+
+	return res
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--grid", choices=list(GRIDS.keys()), default="quick")
+	parser.add_argument("--repeat", type=int, default=5)
+	parser.add_argument("--min-time", type=float, default=.05, help="Min. duration of a timed batch of calls, s")
+	parser.add_argument("--filter", nargs="*", help="Only run benchmarks whose names contain any of these")
+	parser.add_argument("--output", help="JSON file to save the results to")
+	parser.add_argument("--baseline", help="JSON file saved by a previous run to compare against")
+	parser.add_argument("--threshold", type=float, default=.1, help="Relative change that is considered significant")
+	args = parser.parse_args()
+
+	Log.set_hot_path()
+	Log.logger().setLevel(logging.WARNING)
+	results = run_benchmarks(make_grid(GRIDS[args.grid], args.grid == "full"), args.repeat, args.min_time,
+		args.filter)
+
+	if args.output is not None:
+		with open(args.output, 'w') as f:
+			json.dump(dict(grid=args.grid, python=platform.python_version(), machine=platform.machine(),
+				time=time.time(), results=results), f, indent=1)
+
+	if args.baseline is not None:
+		with open(args.baseline, 'r') as f:
+			comparison = compare(results, json.load(f), args.threshold)
+
+		for key, best_baseline, best, ratio, verdict in comparison:
+			print(f"{key:<100} {best_baseline * 1e6:>14.2f} -> {best * 1e6:>14.2f} us {ratio:>6.2f}x {verdict}")
+
+		return int(any(c[-1] == "slower" for c in comparison))
+
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,53 @@
+from pathlib import Path
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "ahpcoord"))
+
+from simulation import *
+from generic import Log
+
+
+class TestScoreCache(unittest.TestCase):
+
+	def setUp(self):
+		Log.filter(fkick={"@sim"})
+		self.directory = tempfile.TemporaryDirectory()
+		self.filename = str(Path(self.directory.name) / "scores.sqlite")
+
+	def tearDown(self):
+		self.directory.cleanup()
+		Log.filter_reset()
+
+	def test_simulation(self):
+		""" A simulation of the same world should get every score from the cache, and give the same results """
+		world_filename = str(Path(self.directory.name) / "world")
+		simulation = Simulation(filename=world_filename, seed=0, score_cache=ScoreCache(self.filename))
+		res = simulation.run()
+		self.assertEqual(len(simulation.score_cache), len(simulation.this_team))
+
+		simulation = Simulation(filename=world_filename, score_cache=ScoreCache(self.filename))
+		simulation._assess_group = None  # Should not be needed
+		self.assertEqual(simulation.run(), res)
+
+		# Changes to the world or the rules make other keys
+		simulation = Simulation(filename=world_filename, score_cache=ScoreCache(self.filename), rules=dataclasses.replace(
+			Simulation.get_default_rules(), ticks_max=4))
+		simulation.run()
+		self.assertEqual(len(simulation.score_cache), 2 * len(simulation.this_team))
+
+	def test_evict(self):
+		""" The least recently used entries go first """
+		cache = ScoreCache(self.filename)
+		cache.put_many([("a", np.zeros(4),), ("b", np.ones(4),)])
+		cache.max_size = cache.get_size()
+		cache.get_many(["a"])  # "b" is the least recently used one now
+		cache.put_many([("c", np.full(4, 2.),)])
+
+		self.assertEqual(sorted(cache.get_many(["a", "b", "c"]).keys()), ["a", "c"])
+		self.assertTrue(np.array_equal(cache.get_many(["c"])["c"], np.full(4, 2.)))
+
+		cache.max_size = 0
+		cache.evict()
+		self.assertEqual(len(cache), 0)
@@ -0,0 +1,51 @@
+from pathlib import Path
+import sys
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "ahpcoord"))
+
+from engine import *
+from generic import Log
+
+
+class TestEngine(unittest.TestCase):
+
+	def setUp(self):
+		Log.filter(fkick={"@sim"})
+
+	def tearDown(self):
+		Log.filter_reset()
+
+	def test_run(self):
+		for columnar in [False, True]:
+			simulation = Simulation(seed=0, columnar=columnar)
+			engine = Engine(simulation, seed=0)
+			stats = engine.run(12)
+
+			self.assertEqual(stats["n_ticks"], 12)
+			self.assertTrue(stats["ticks_per_second"] > 0)
+			self.assertTrue((engine.energy >= 0).all())
+
+			# The world reflects the engine's state
+			for agent_id, coord, energy in zip(engine.agent_id, engine.coord, engine.energy):
+				agent = simulation.world.get_agent(agent_id=int(agent_id))
+				self.assertAlmostEqual(agent.energy, energy)
+				self.assertEqual(list(agent.coord), list(coord))
+
+			near = simulation.world.get_agents_near([4, 4], 2)
+			self.assertEqual(sorted(a.id for a in near), sorted(engine.agent_id[np.abs(engine.coord - 4).sum(axis=1) <= 2]))
+
+	def test_event_engine(self):
+		simulation = Simulation(seed=0, columnar=True)
+		engine = EventEngine(simulation, seed=0, decision_period=4, rival_activity=Activity.HIT)
+		stats = engine.run(10)
+
+		self.assertEqual(engine.n_ticks, 10)
+		self.assertTrue(stats["n_events"] > 0)
+		self.assertTrue((engine.energy >= 0).all())
+		self.assertTrue(stats["n_alive"] < int(engine.is_hitter.sum()))  # Somebody has lost a fight
+
+		ids, coord, energy, *_ = simulation.world.get_columns()
+		self.assertTrue(np.array_equal(ids, engine.agent_id))
+		self.assertTrue(np.array_equal(coord, engine.coord))
+		self.assertTrue(np.array_equal(energy, engine.energy))
@@ -1,4 +1,5 @@
 import unittest
+import copy
 from pathlib import Path
 import sys
 
@@ -39,4 +40,149 @@ class TestWorld(unittest.TestCase):
 		self.assertTrue(self.world.calc_agents() == self.n_agents * 2)
 		self.assertTrue(len(self.world.get_resources()) == self.n_agents)
 
+	def test_load_save_binary(self):
+		self.world.save("echo", binary=True)
 
+		for columnar in [False, True]:
+			world = World(columnar=columnar)
+			world.load("echo")
+			self.assertEqual(world.calc_agents(), self.n_agents * 2)
+			self.assertEqual(len(world.get_resources()), self.n_agents)
+
+			for agent in world.get_resources():
+				loaded = agent.to_agent() if columnar else agent
+				self.assertEqual(loaded, self.world.get_agent(agent_id=agent.id))
+
+			world.load("echo", team_ids=[0], region=([0, 0], [5, 5]))
+			expected = [a.id for a in self.world.get_agents_near([0, 0], 20) if a.team == 0 and max(a.coord) < 5]
+			self.assertEqual(sorted(a.id for a in world.get_agents_near([0, 0], 20)), sorted(expected))
+
+	def test_load_save_mapped(self):
+		""" A columnar world works on the file's memory maps; changing and saving it over the file should be safe """
+		self.world.save("echo", binary=True)
+		world = World(columnar=True)
+		world.load("echo")
+		column = world.get_table().coord
+
+		while column.base is not None and not isinstance(column, np.memmap):
+			column = column.base
+
+		self.assertTrue(isinstance(column, np.memmap))
+
+		world.update_agent(0, coord=[1, 2], energy=3)
+		world.add_agent(self.factory.gen_hitter())
+		world_file = WorldFile("echo")  # Changes should not reach the file until it is saved
+		row = world_file.columns["id"].tolist().index(0)
+		self.assertEqual(world_file.columns["coord"][row].tolist(), list(self.world.get_agent(agent_id=0).coord))
+
+		world.save("echo", binary=True)
+		self.assertEqual(list(world.get_agent(agent_id=0).coord), [1, 2])
+
+		world_loaded = World(columnar=True)
+		world_loaded.load("echo")
+		self.assertEqual(world_loaded.calc_agents(), self.n_agents * 2 + 1)
+		self.assertEqual(world_loaded.get_agent(agent_id=0).to_agent(), world.get_agent(agent_id=0).to_agent())
+
+	def test_gen_bulk(self):
+		worlds = [World(), World(columnar=True)]
+
+		for world in worlds:
+			factory = dataclasses.replace(self.factory)
+			factory.populate(world, 20, 10, seed=1)
+
+		self.assertEqual(worlds[0].calc_agents(), 30)
+		self.assertEqual(len(worlds[0].get_resources()), 10)
+
+		for agent in worlds[1].get_resources() + (worlds[1].get_agent(team_id=1) or []):
+			self.assertEqual(agent.to_agent(), worlds[0].get_agent(agent_id=agent.id))
+
+		columns = self.factory.gen_bulk(20, 10, seed=1)
+		self.assertTrue(np.array_equal(columns[1], self.factory.gen_bulk(20, 10, seed=1)[1]))
+		self.assertFalse(np.array_equal(columns[1], self.factory.gen_bulk(20, 10, seed=2)[1]))
+
+		# Hitters do not depend on the number of resources
+		columns_other = self.factory.gen_bulk(20, 15, seed=1)
+
+		for column, column_other in zip(columns[1:], columns_other[1:]):
+			self.assertTrue(np.array_equal(column[10:], column_other[15:]))
+
+	def test_get_agents_near(self):
+		radius = 3
+
+		for agent in self.world.get_resources():
+			self.world.update_agent(agent.id, coord=self.factory.gen_coord())
+
+		for coord in [[0, 0], [5, 5], [9.5, 2]]:
+			near = self.world.get_agents_near(coord, radius)
+			expected = [a for a in map(lambda i: self.world.get_agent(agent_id=i), range(self.n_agents * 2))
+				if sum(abs(c - ca) for c, ca in zip(coord, a.coord)) <= radius]
+
+			self.assertEqual(sorted(a.id for a in near), sorted(a.id for a in expected))
+
+	def test_get_distance(self):
+		def chk():
+			for i in range(self.world.calc_agents()):
+				for j in range(self.world.calc_agents()):
+					a, b = self.world.get_agent(agent_id=i), self.world.get_agent(agent_id=j)
+					self.assertAlmostEqual(self.world.get_distance(a, b), sum(abs(c - cb) for c, cb in zip(a.coord, b.coord)))
+
+		chk()
+		self.world.update_agent(0, coord=[0, 0])
+		self.world.update_agent(3, coord=[9, 9])
+		chk()
+		self.world.add_agent(self.factory.gen_hitter())
+		chk()
+
+	def test_update_agents(self):
+		""" A bulk update should leave either storage as separate `update_agent` calls do """
+		agent_ids = np.arange(0, self.n_agents * 2, 3)
+		coord = np.array([self.factory.gen_coord() for _ in agent_ids])
+		energy = np.arange(len(agent_ids), dtype=float)
+
+		for columnar in [False, True]:
+			world, world_single = World(columnar=columnar), World()
+
+			for agent in [self.world.get_agent(agent_id=i) for i in range(self.n_agents * 2)]:
+				world.add_agent(copy.deepcopy(agent))
+				world_single.add_agent(copy.deepcopy(agent))
+
+			world.get_distance(world.get_agent(agent_id=0), world.get_agent(agent_id=1))
+			world.update_agents(agent_ids, coord, energy)
+
+			for agent_id, c, e in zip(agent_ids.tolist(), coord.tolist(), energy.tolist()):
+				world_single.update_agent(agent_id, coord=c, energy=e)
+
+			dirty, dirty_single = world.pop_dirty(), world_single.pop_dirty()
+			order, order_single = np.argsort(dirty[0]), np.argsort(dirty_single[0])
+
+			for column, column_single in zip(dirty, dirty_single):
+				self.assertEqual(column[order].tolist(), column_single[order_single].tolist())
+
+			self.assertEqual([len(column) for column in world.pop_dirty()], [0, 0, 0])
+
+			for agent_id in range(self.n_agents * 2):
+				a, b = world.get_agent(agent_id=agent_id), world_single.get_agent(agent_id=agent_id)
+				self.assertEqual((list(a.coord), a.energy,), (list(b.coord), b.energy,))
+				self.assertAlmostEqual(world.get_distance(a, world.get_agent(agent_id=0)),
+					world_single.get_distance(b, world_single.get_agent(agent_id=0)))
+
+			for c in [[0, 0], [5, 5], [9.5, 2]]:
+				self.assertEqual(sorted(a.id for a in world.get_agents_near(c, 3)),
+					sorted(a.id for a in world_single.get_agents_near(c, 3)))
+
+	def test_columnar(self):
+		world = World(columnar=True)
+
+		for agent in (self.world.get_agent(team_id=0) or []) + self.world.get_resources():
+			world.add_agent(agent)
+
+		world.update_agent(self.world.get_resources()[0].id, coord=[1, 2], energy=3)
+		resource = world.get_resources()[0]
+		self.assertEqual(resource.coord.tolist(), [1, 2])
+		self.assertEqual(resource.energy, 3)
+		self.assertEqual(resource.type, Agent.Type.RESOURCE)
+		self.assertTrue(world.get_table().energy.base is not None)  # Columns are not copied
+
+		for agent in world.get_agent(team_id=0) or []:
+			self.assertEqual(agent.to_agent(), self.world.get_agent(agent_id=agent.id))
+			self.assertEqual(agent.team, 0)
@@ -0,0 +1,75 @@
+import logging
+from pathlib import Path
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "ahpcoord"))
+
+from generic import Log
+
+
+class TestLog(unittest.TestCase):
+
+	class Formattable:
+
+		def __init__(self):
+			self.n_formatted = 0
+
+		def __str__(self):
+			self.n_formatted += 1
+			return "formattable"
+
+	def setUp(self):
+		self.level = Log.logger().level
+		self.arg = TestLog.Formattable()
+
+	def tearDown(self):
+		Log.logger().setLevel(self.level)
+		Log.set_hot_path(False)
+		Log.filter_reset()
+
+	def test_disabled_level_not_formatted(self):
+		Log.logger().setLevel(logging.INFO)
+		Log.debug(self.test_disabled_level_not_formatted, self.arg)
+		Log.filter(fkick={"kick"})
+		Log.debug(self.test_disabled_level_not_formatted, self.arg)
+		self.assertEqual(self.arg.n_formatted, 0)
+
+		Log.info(self.test_disabled_level_not_formatted, self.arg)
+		self.assertTrue(self.arg.n_formatted > 0)
+
+	def test_hot_path(self):
+		Log.set_hot_path(True)
+		Log.debug(self.test_hot_path, self.arg)
+		self.assertEqual(self.arg.n_formatted, 0)
+
+		Log.set_hot_path(False)
+		Log.debug(self.test_hot_path, self.arg)
+		self.assertTrue(self.arg.n_formatted > 0)
+
+	def test_fmt_path(self):
+		""" Paths get shortened as long as the files exist, whenever those have been created """
+		with tempfile.TemporaryDirectory() as directory:
+			filename = str(Path(directory) / "file.txt")
+			self.assertIn(filename, Log.fmt(filename))
+
+			open(filename, 'w').close()
+			self.assertNotIn(filename, Log.fmt(filename))
+
+			os.remove(filename)
+			self.assertIn(filename, Log.fmt(filename))
+
+	def test_fmt_path_bare(self):
+		""" Bare names of existing files are paths, too """
+		with tempfile.TemporaryDirectory() as directory:
+			cwd = os.getcwd()
+			os.chdir(directory)
+
+			try:
+				self.assertEqual(Log.fmt("action", "message"), "[]  action message")
+				os.mkdir("action")
+				self.assertEqual(Log.fmt("action", "message"), "[action]  message")
+			finally:
+				os.chdir(cwd)
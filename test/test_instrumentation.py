@@ -0,0 +1,55 @@
+from pathlib import Path
+import sys
+import unittest
+import random
+import json
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "ahpcoord"))
+
+from instrumentation import *
+from simulation import Simulation
+from generic import Log
+
+
+class TestInstrumentation(unittest.TestCase):
+
+	def setUp(self):
+		random.seed(0)
+		Log.filter(fkick={"@sim"})
+		self.simulation = Simulation()
+		Instrumentation.reset()
+
+	def tearDown(self):
+		Instrumentation.disable()
+		Log.filter_reset()
+
+	def test_run(self):
+		Instrumentation.enable()
+		self.simulation.invalidate_scores()
+		self.simulation.run()
+		Instrumentation.disable()
+		self.simulation.run()  # Not counted
+
+		snapshot = json.loads(Instrumentation.to_json())
+		self.assertEqual(len(snapshot["runs"]), 1)
+		self.assertEqual(snapshot["calls"]["Simulation._synthesize"]["count"], 1)
+		self.assertTrue(snapshot["calls"]["ReasoningModel.calc_expected_gain_batch"]["count"] > 0)
+		self.assertTrue(snapshot["calls"]["ReasoningModel.__calc_expected_gain_batch"]["total"] > 0)
+		self.assertTrue(snapshot["created"]["Outcome"] > 0)
+
+	def test_disable(self):
+		calc_int_hit = ReasoningModel.calc_int_hit
+		is_reachable = RulesInterp.is_reachable
+		Instrumentation.enable()
+		self.assertIsNot(ReasoningModel.calc_int_hit, calc_int_hit)
+
+		agent = self.simulation.this_team[0]
+		self.simulation.reasoning_model.calc_int_hit(agent, 5, Activity.HIT, self.simulation.rivals[0])
+		self.assertEqual(Instrumentation.snapshot()["calls"]["ReasoningModel.calc_int_hit"]["count"], 1)
+		self.assertTrue(Instrumentation.snapshot()["created"]["Situation"] > 0)
+
+		Instrumentation.disable()
+		self.assertIs(ReasoningModel.calc_int_hit, calc_int_hit)
+		self.assertIs(RulesInterp.is_reachable, is_reachable)
+		Instrumentation.reset()
+		self.assertEqual(Instrumentation.snapshot()["calls"], dict())
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 from pathlib import Path
 import sys
 import unittest
@@ -67,6 +68,65 @@ class TestReasoningModel(unittest.TestCase):
 		Log.debug(TestReasoningModel.test_calc_int_hit, outcome)
 		self.assertTrue(outcome.gain.energy > 0)
 
+	def test_outcome(self):
+		outcome = self.reasoning_model.calc_mv(self.agent_this, 2, Activity.IDLE)
+		outcome_other = self.reasoning_model.calc_mv(self.agent_this, 2, Activity.RUN)
+
+		self.assertTrue(outcome.gain.energy > 0)
+		self.assertEqual(outcome.loss.energy, 0)  # Outcomes do not share their values
+		self.assertTrue(outcome_other.loss.energy > 0)
+
+		outcome.accumulate(outcome_other, 2)
+		self.assertEqual(outcome.loss.energy, 2 * outcome_other.loss.energy)
+		self.assertEqual(Outcome.stack([outcome, outcome_other]).shape, (2, 6))
+
+	def test_calc_int_hit_ticks(self):
+		""" Evaluating the whole tick horizon at once should be the same as doing that tick by tick """
+		this_agent = Agent(id=1, team=0, coord=[1, 1], energy=5, type=Agent.Type.HITTER)
+		fightable_agent = Agent(id=2, team=1, coord=[2, 1.5], energy=4, type=Agent.Type.HITTER)
+		ticks = list(range(1, self.rules.ticks_max + 1))
+
+		for activity in Activity:
+			outcome = self.reasoning_model.calc_int_hit(this_agent, np.array(ticks), activity, fightable_agent)
+
+			for i, t in enumerate(ticks):
+				outcome_t = self.reasoning_model.calc_int_hit(this_agent, t, activity, fightable_agent)
+
+				for field in ["gain", "loss", "enemy_loss"]:
+					for score in ["energy", "resource"]:
+						value = np.broadcast_to(getattr(getattr(outcome, field), score), (len(ticks),))[i]
+						self.assertTrue(math.isclose(value, getattr(getattr(outcome_t, field), score)))
+
+	def test_fight_energy_table(self):
+		""" A table shared across calls should give what `RulesInterp` does """
+		energy_table = FightEnergyTable(self.rules)
+		ticks = np.arange(1, self.rules.ticks_max)
+
+		for agent_other in self.agents_other[:4]:
+			for activity in Activity:
+				outcome = self.reasoning_model.calc_int_hit(self.agent_this, ticks, activity, agent_other, energy_table)
+				outcome_own = self.reasoning_model.calc_int_hit(self.agent_this, ticks, activity, agent_other)
+				energy = RulesInterp.get_energy_before_fight(self.rules, Situation(agent=agent_other, activity=activity,
+					ticks=ticks))
+
+				self.assertTrue(np.array_equal(outcome.values, outcome_own.values))
+				self.assertTrue(np.array_equal(energy_table.get(agent_other, activity, ticks), energy))
+
+	def test_fight_energy_table_off_range(self):
+		""" Ticks past `ticks_max`, or fractional ones, should fall back to `RulesInterp` """
+		energy_table = FightEnergyTable(self.rules)
+
+		for ticks in (self.rules.ticks_max + 1, 2.5, np.array([1, self.rules.ticks_max + 1]),):
+			for activity in Activity:
+				outcome = self.reasoning_model.calc_int_hit(self.agent_this, ticks, activity, self.agents_other[0],
+					energy_table)
+				outcome_own = self.reasoning_model.calc_int_hit(self.agent_this, ticks, activity, self.agents_other[0])
+				energy = RulesInterp.get_energy_before_fight(self.rules, Situation(agent=self.agents_other[0],
+					activity=activity, ticks=ticks))
+
+				self.assertTrue(np.array_equal(outcome.values, outcome_own.values))
+				self.assertTrue(np.array_equal(energy_table.get(self.agents_other[0], activity, ticks), energy))
+
 	def __setup_surroundings(self):
 		dist_reachable = self.rules.movement.speed * 1
 		dist_maybe_reachable = (self.rules.ticks_max + 1) * self.rules.movement.speed
@@ -163,6 +223,100 @@ class TestReasoningModel(unittest.TestCase):
 			self.assertTrue(outcome.enemy_loss.energy > outcome_agent_weaker.enemy_loss.energy)
 			self.assertTrue(outcome.enemy_loss.resource > outcome_agent_weaker.enemy_loss.resource)
 
+	def test_calc_expected_gain_batch(self):
+		""" The vectorized path should match the scalar one """
+		Log.filter(fkick={"reasoning_model"})
+
+		agents = [Agent(id=i, coord=[random() * 4, random() * 4], energy=1 + random() * 4, type=Agent.Type.HITTER, team=1)
+			for i in range(20, 25)]
+		scores = self.reasoning_model.calc_expected_gain_batch(agents, self.agents_other)
+
+		Log.filter_reset()
+		self.assertEqual(scores.shape, (len(agents), len(list(SubStrategy)), len(list(Activity))))
+
+		for i, agent in enumerate(agents):
+			for j, aspect in enumerate(SubStrategy):
+				for k, activity in enumerate(Activity):
+					res = self.reasoning_model.calc_expected_gain(agent, self.agents_other, aspect, activity)
+					self.assertTrue(math.isclose(res, scores[i, j, k], rel_tol=1e-9, abs_tol=1e-12))
+
+	def test_calc_expected_gains(self):
+		""" All aspects at once should match the aspects taken one by one, and a per-tick evaluation """
+		agent = Agent(id=1, coord=[1, 1], energy=3, type=Agent.Type.HITTER, team=1)
+		agent_lonely = Agent(id=2, coord=[30, 30], energy=4, type=Agent.Type.HITTER, team=1)
+		agents_other = [
+			Agent(id=3, coord=[1.5, 1], energy=2, type=Agent.Type.HITTER, team=2),
+			Agent(id=4, coord=[1, 1.2], energy=4, type=Agent.Type.HITTER, team=2),
+			Agent(id=5, coord=[1.3, 1.4], energy=3, type=Agent.Type.RESOURCE, team=0),
+			Agent(id=6, coord=[1.2, 1.2], energy=3, type=Agent.Type.HITTER, team=1),
+		]
+
+		def get_expected(a, activity):
+			n_ticks = RulesInterp.get_ticks_available(self.rules, Situation(agent=a, activity=activity))
+
+			if n_ticks <= 0:
+				return np.zeros(len(list(SubStrategy)))
+
+			situations = [Situation(agent=a, agent_other=ao, activity=activity, ticks=n_ticks) for ao in agents_other]
+			reachable = [ao for ao, s in zip(agents_other, situations) if (RulesInterp.is_fightable(self.rules, s) or
+				activity == Activity.TAKE and RulesInterp.is_gatherable(self.rules, s)) and
+				RulesInterp.is_reachable(self.rules, s)]
+			dist_sum = sum(self.reasoning_model.get_distance(a, ao) for ao in reachable)
+			res = sum(Outcome.to_scores(self.reasoning_model.calc_mv(a, t, activity).values) for t in range(1, n_ticks + 1))
+
+			for t in range(1, n_ticks):
+				for ao in reachable:
+					s = Situation(agent=a, agent_other=ao, ticks=t, activity=activity)
+					outcome = self.reasoning_model.calc_int_hit(a, t, activity, ao) if RulesInterp.is_fightable(
+						self.rules, s) else self.reasoning_model.calc_int_take(a, t, activity, ao)
+					res = res + Outcome.to_scores(outcome.values) * self.reasoning_model.get_distance(a, ao) / dist_sum
+
+			return res / n_ticks
+
+		for a in [agent, agent_lonely]:
+			for activity in Activity:
+				gains = self.reasoning_model.calc_expected_gains(a, agents_other, activity)
+				self.assertEqual(list(gains.keys()), list(SubStrategy))
+
+				for aspect, expected in zip(SubStrategy, get_expected(a, activity)):
+					self.assertTrue(math.isclose(gains[aspect], self.reasoning_model.calc_expected_gain(a, agents_other,
+						aspect, activity), rel_tol=1e-12, abs_tol=1e-12))
+					self.assertTrue(math.isclose(gains[aspect], expected, rel_tol=1e-9, abs_tol=1e-12))
+
+	def test_calc_expected_gain_all(self):
+		""" Assessing all teams at once should match assessing each hitter against the others, at the reach bound too """
+		rng = np.random.default_rng(0)
+		reach = RulesInterp.get_reach_distance(self.rules)
+		hitters = [Agent(id=i, coord=list(rng.random(2) * 3 * reach), energy=rng.random() * 5, type=Agent.Type.HITTER,
+			team=i % 3) for i in range(30)]
+		hitters.append(Agent(id=30, coord=[hitters[0].coord[0] + reach, hitters[0].coord[1]], energy=5,
+			type=Agent.Type.HITTER, team=1))
+		resources = [Agent(id=i, coord=list(rng.random(2) * 3 * reach), energy=5, type=Agent.Type.RESOURCE) for i in
+			range(31, 40)]
+
+		for agents_other in [resources, []]:
+			scores = self.reasoning_model.calc_expected_gain_all(hitters, agents_other)
+
+			for agent, agent_scores in zip(hitters, scores):
+				expected = self.reasoning_model.calc_expected_gain_batch([agent], [a for a in hitters if
+					a.team != agent.team] + agents_other)[0]
+				self.assertTrue(np.allclose(agent_scores, expected, rtol=1e-9, atol=1e-12))
+
+	def test_calc_expected_gain_batch_approximation(self):
+		""" Sampled scores should stay within a few standard errors of the exact ones """
+		rng = np.random.default_rng(0)
+		agents = [Agent(id=i, coord=list(rng.random(2) * 4), energy=1 + rng.random() * 4, type=Agent.Type.HITTER, team=1)
+			for i in range(20, 25)]
+		agents_other = [Agent(id=i, coord=list(rng.random(2) * 4), energy=1 + rng.random() * 4, type=Agent.Type.HITTER,
+			team=2) for i in range(30, 130)]
+		scores = self.reasoning_model.calc_expected_gain_batch(agents, agents_other)
+		model = ReasoningModel(self.rules, approximation=Approximation(n_samples=16, seed=0))
+		errors = np.zeros(scores.shape)
+		scores_approx = model.calc_expected_gain_batch(agents, agents_other, errors)
+
+		self.assertTrue(np.any(errors > 0))
+		self.assertTrue(np.all(np.abs(scores_approx - scores) <= 4 * errors + 1e-12))
+
 
 class TestRulesInterp(unittest.TestCase):
 
@@ -0,0 +1,144 @@
+from pathlib import Path
+import sys
+import unittest
+import random
+import tempfile
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "ahpcoord"))
+
+from simulation import *
+from generic import Log
+
+
+class TestSimulation(unittest.TestCase):
+
+	def setUp(self):
+		random.seed(0)
+		Log.filter(fkick={"simulation", "reasoning_model"})
+		self.simulation = Simulation()
+		print("")
+
+	def tearDown(self):
+		Log.filter_reset()
+
+	def test_world_file(self):
+		""" A world file given should be loaded as it is, not rewritten """
+		with tempfile.TemporaryDirectory() as directory:
+			filename = os.path.join(directory, "world")
+			self.simulation.world.save(filename, binary=True)
+			simulation = Simulation(filename, columnar=True)
+			self.assertTrue(WorldFile.is_world_file(filename))
+			self.assertEqual(simulation.run(), self.simulation.run())
+
+	def test_run_parallel(self):
+		""" A parallel run should give the same results as a serial one """
+		for batch in [True, False]:
+			self.simulation.batch = batch
+			self.simulation.n_workers = 1
+			self.simulation.invalidate_scores()
+			res = self.simulation.run()
+			self.simulation.n_workers = 3
+			self.simulation.invalidate_scores()
+			res_parallel = self.simulation.run()
+
+			self.assertEqual(res, res_parallel)
+
+	def test_run_parallel_approximation(self):
+		""" Rivals sampled by parallel workers should be the same as those sampled in a serial run """
+		simulation = Simulation(approximation=Approximation(n_samples=2))
+		res = simulation.run()
+		self.assertTrue(simulation.get_score_errors().any())  # Sampled indeed
+
+		simulation.n_workers = 3
+		simulation.invalidate_scores()
+		res_parallel = simulation.run()
+
+		self.assertEqual(res, res_parallel)
+
+	def test_run_cached(self):
+		""" Changing the preference graph reuses the low-level scores, but should not change the results """
+		self.simulation.run()
+		self.simulation.update_secure_to_invasive(.5)
+		res = self.simulation.run()
+		self.simulation.invalidate_scores()
+
+		self.assertEqual(res, self.simulation.run())
+
+	def test_run_dirty(self):
+		""" Only the scores affected by agents' updates get recomputed, the results match a full run """
+		self.simulation.run()
+		agent, rival = self.simulation.this_team[0], self.simulation.rivals[0]
+		self.simulation.world.update_agent(rival.id, coord=list(agent.coord))
+		self.simulation.world.update_agent(self.simulation.this_team[1].id, energy=1)
+		res = self.simulation.run()
+		self.simulation.invalidate_scores()
+
+		self.assertEqual(res, self.simulation.run())
+
+	def test_native_ahp(self):
+		""" Synthesis by `BatchGraph` should match the one by ahpy `Graph` """
+		for secure_to_invasive in [.1, 1, 10]:
+			self.simulation.update_secure_to_invasive(secure_to_invasive)
+			self.simulation.native_ahp = True
+			res = self.simulation.run()
+			self.simulation.native_ahp = False
+			res_graph = self.simulation.run()
+
+			for weights, weights_graph in zip(res, res_graph):
+				for activity in Activity:
+					self.assertAlmostEqual(weights[activity.value], weights_graph[activity.value], places=6)
+
+	def test_run_all_teams(self):
+		""" Evaluating all teams at once should match running this team alone """
+		self.simulation.world.update_agent(self.simulation.rivals[0].id, energy=0)
+
+		for skip_depleted in [False, True]:
+			self.simulation.skip_depleted = skip_depleted
+			self.simulation.invalidate_scores()
+			res = self.simulation.run_all_teams()[Simulation.THIS_TEAM]
+
+			for weights, weights_run in zip(res, self.simulation.run()):
+				for activity in Activity:
+					self.assertAlmostEqual(weights[activity.value], weights_run[activity.value], places=9)
+
+	def test_action_data_adaptive(self):
+		""" The adaptive sweep should give the same histograms as the fixed grid does, at the grid's points """
+		action_data = get_action_data(self.simulation)
+		action_data_adaptive = get_action_data(self.simulation, adaptive=True)
+
+		for i, s2i in enumerate(action_data['x']):
+			j = max(k for k, x in enumerate(action_data_adaptive['x']) if x <= s2i)
+
+			for activity in Activity:
+				self.assertEqual(action_data[activity.value][i], action_data_adaptive[activity.value][j])
+
+	def test_action_data_checkpoint(self):
+		""" A sweep resumed from a checkpoint, even in another world, should finish as an uninterrupted one does """
+		action_data = get_action_data(self.simulation)
+
+		with tempfile.TemporaryDirectory() as directory:
+			checkpoint = str(Path(directory) / "checkpoint")
+			run = self.simulation.run
+			n_runs = [0]
+
+			def run_interrupted():
+				n_runs[0] += 1
+
+				if n_runs[0] > 42:
+					raise KeyboardInterrupt
+
+				return run()
+
+			self.simulation.run = run_interrupted
+			self.assertRaises(KeyboardInterrupt, get_action_data, self.simulation, checkpoint=checkpoint)
+			self.assertEqual(len(load_action_data(checkpoint)["activities"]['x']), 42)
+
+			simulation = Simulation()
+			self.assertEqual(get_action_data(simulation, checkpoint=checkpoint), action_data)
+			self.assertEqual(simulation.world.get_digest(), self.simulation.world.get_digest())
+			self.assertRaises(ValueError, get_action_data, simulation, adaptive=True, checkpoint=checkpoint)
+
+			# Scores saved under other rules should not be reused
+			rules = dataclasses.replace(Simulation.get_default_rules(), ticks_max=4)
+			self.assertRaises(ValueError, get_action_data, Simulation(rules=rules), checkpoint=checkpoint)
+			self.assertRaises(ValueError, get_action_data, Simulation(batch=False), checkpoint=checkpoint)
@@ -0,0 +1,67 @@
+from pathlib import Path
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "ahpcoord"))
+
+from simulation import *
+from sink import *
+from generic import Log
+
+
+class TestSink(unittest.TestCase):
+
+	def setUp(self):
+		Log.filter(fkick={"@sim"})
+		self.simulation = Simulation(seed=0)
+		self.directory = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.directory.cleanup()
+		Log.filter_reset()
+
+	def test_run_iter(self):
+		""" Streamed results, and those written to the sinks, should match `run`'s """
+		res = dict(zip([a.id for a in self.simulation.this_team], self.simulation.run()))
+		self.simulation.invalidate_scores()
+		filename_jsonl = str(Path(self.directory.name) / "res.jsonl")
+		filename_binary = str(Path(self.directory.name) / "res.bin")
+
+		with JsonlSink(filename_jsonl) as sink_jsonl, BinarySink(filename_binary) as sink_binary:
+			res_iter = list(self.simulation.run_iter([sink_jsonl, sink_binary], chunk_size=7))
+
+		self.assertEqual(dict(res_iter), res)
+		self.assertEqual(hist_action(w for _, w in res_iter), hist_action(res.values()))
+		self.assertEqual(list(JsonlSink.read(filename_jsonl)), res_iter)
+
+		records = BinarySink.read(filename_binary)
+		self.assertEqual(records["id"].tolist(), [agent_id for agent_id, _ in res_iter])
+
+		for record in records:
+			self.assertEqual(record["weights"].tolist(), [res[int(record["id"])][a.value] for a in Activity])
+
+		# Scores consumed by sinks are not kept in memory, but go to the score cache
+		self.assertEqual(self.simulation.get_cached_scores(), dict())
+
+		# Cached scores get streamed too
+		self.assertEqual(dict(self.simulation.run_iter(chunk_size=7)), res)
+		self.assertEqual(len(self.simulation.get_cached_scores()), len(res))
+		self.assertEqual(dict(self.simulation.run_iter(chunk_size=7)), res)
+
+	def test_run_iter_parallel(self):
+		""" Results of workers should be streamed in order, and match the serial ones """
+		res = list(self.simulation.run_iter(chunk_size=7))
+		self.simulation.invalidate_scores()
+		self.simulation.n_workers = 2
+
+		self.assertEqual(list(self.simulation.run_iter(chunk_size=7)), res)
+
+	def test_run_iter_score_cache(self):
+		""" Each group's scores should reach the score cache while the rest are still being streamed """
+		self.simulation.score_cache = ScoreCache(str(Path(self.directory.name) / "scores.sqlite"))
+		stream = self.simulation.run_iter()
+		next(stream)
+		self.assertGreater(len(self.simulation.score_cache), 0)
+		stream.close()
+		self.simulation.score_cache.close()